@@ -1,28 +1,25 @@
-import tritonclient.http as httpclient
-import numpy as np
+import httpx
 import json
 
-# Создаем клиент, указывая адрес сервера
-client = httpclient.InferenceServerClient(url="localhost:8000")
+# Адрес Triton и имя модели - те же, что использует main.py
+TRITON_URL = "localhost:8000"
+MODEL_NAME = "mixtral"
 
 # Пользовательский запрос
 user_prompt = "Создай 3 слайда про строение атома для 8 класса"
 
-# Подготавливаем входной тензор
-prompt_tensor = httpclient.InferInput("USER_PROMPT", [1], "BYTES")
-prompt_tensor.set_data_from_numpy(np.array([user_prompt.encode('utf-8')], dtype=np.object_))
-
 print(f"Отправка запроса к Triton: '{user_prompt}'")
 
-# Отправляем запрос на инференс
-response = client.infer(
-    model_name="eduscribe_mixtral",
-    inputs=[prompt_tensor]
+# Отправляем запрос на инференс через generate-расширение (входной тензор "prompt")
+response = httpx.post(
+    f"http://{TRITON_URL}/v2/models/{MODEL_NAME}/generate",
+    json={"prompt": user_prompt, "stream": False},
+    timeout=300,
 )
+response.raise_for_status()
 
-# Получаем результат из выходного тензора
-result_bytes = response.as_numpy("GENERATED_JSON")[0]
-result_json_str = result_bytes.decode('utf-8')
+# Получаем результат из выходного тензора "generated_text"
+result_json_str = response.json()["generated_text"]
 
 # Преобразуем строку в словарь и красиво печатаем
 result_data = json.loads(result_json_str)
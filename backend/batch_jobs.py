@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+import uuid
+
+import orjson
+
+
+logger = logging.getLogger(__name__)
+
+
+class TooManyJobsError(Exception):
+    """одновременно выполняется слишком много пакетных заданий"""
+
+
+class BatchJob:
+    """
+    Пакетная генерация: готовые записи (строки NDJSON) копятся по мере готовности
+    и не зависят от HTTP-соединения. Клиент читает их с любого места через stream(offset),
+    поэтому после обрыва связи задание можно дочитать по его id.
+    """
+    def __init__(self, owner: str, total: int):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.total = total
+        self.lines = []               # готовые строки NDJSON (bytes, с переводом строки)
+        self.finished_at = None
+        self.task = None
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def add(self, record: dict):
+        self.add_line(orjson.dumps(record) + b"\n")
+
+    def add_line(self, line: bytes):
+        self.lines.append(line)
+        self._notify()
+
+    def finish(self, record: dict):
+        """последняя запись задания; после неё stream() завершается"""
+        if self.done:
+            return
+        self.lines.append(orjson.dumps(record) + b"\n")
+        self.finished_at = time.time()
+        self._notify()
+
+    def _notify(self):
+        # будим всех читателей; новые будут ждать уже следующего изменения
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def stream(self, offset: int = 0):
+        """записи начиная с offset-й; ждёт новые, пока задание не завершится"""
+        while True:
+            changed = self._changed
+            while offset < len(self.lines):
+                yield self.lines[offset]
+                offset += 1
+            if self.done:
+                return
+            await changed.wait()
+
+
+class BatchJobStore:
+    """
+    Задания в памяти процесса: не больше max_active одновременно выполняющихся,
+    завершённые хранятся ttl секунд, чтобы их можно было дочитать.
+    """
+    def __init__(self, max_active: int = 8, ttl: float = 3600.0):
+        self.max_active = max_active
+        self.ttl = ttl
+        self._jobs = {}
+
+    @property
+    def active(self) -> int:
+        return sum(not job.done for job in self._jobs.values())
+
+    def create(self, owner: str, total: int) -> BatchJob:
+        self._expire()
+        if self.active >= self.max_active:
+            raise TooManyJobsError(f"Уже выполняется {self.active} пакетных заданий, повторите позже")
+        job = BatchJob(owner, total)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str, owner: str):
+        """задание по id, если оно есть и принадлежит owner, иначе None"""
+        self._expire()
+        job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    def cancel_all(self):
+        """останавливает незавершённые задания (при остановке приложения)"""
+        for job in self._jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished_at + self.ttl < now]:
+            del self._jobs[job_id]
@@ -0,0 +1,213 @@
+"""
+Локальная замена Triton Inference Server для бенчмарков прокси-слоя без GPU.
+
+Реализует нужную бэкенду часть HTTP API KServe v2:
+/v2/health/live, /v2/health/ready, /v2/models/{name}/ready,
+/v2/models/{name}/infer (JSON и бинарное расширение тензоров), /v2/models/{name}/generate
+и /v2/models/{name}/generate_stream.
+Задержка ответа, скорость выдачи токенов, доля некорректного JSON и отказов настраиваются:
+
+    python bench/fake_triton.py --port 8000 --latency-median 2 --latency-sigma 0.5 \
+        --token-rate 40 --malformed-rate 0.02 --failure-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import struct
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+app = FastAPI(title="Fake Triton")
+config = argparse.Namespace()
+
+SAMPLE_TOPICS = ["Строение атома", "Фотосинтез", "Дроби", "Великая французская революция"]
+
+
+def make_presentation(prompt: str) -> dict:
+    """детерминированная для промпта презентация заданного размера"""
+    rng = random.Random(prompt)
+    topic = rng.choice(SAMPLE_TOPICS)
+    slides = [{"type": "title_slide", "title": topic, "subtitle": "Урок для 8 класса"}]
+    for i in range(config.slides):
+        slides.append({
+            "type": "content_slide",
+            "title": f"{topic}: часть {i + 1}",
+            "content": [f"Тезис №{j + 1} о теме «{topic}», изложенный простым языком." for j in range(4)],
+            "image_description": f"Схема к слайду {i + 1}: {topic.lower()}, подписи на русском языке.",
+        })
+    slides.append({"type": "final_slide", "title": "Итоги", "subtitle": "Спасибо за внимание!"})
+    return {"title": topic, "slides": slides}
+
+
+def make_slides_patch(inputs: dict) -> dict:
+    """ответ режима правки: slide_count новых слайдов"""
+    instruction = inputs.get("prompt", "")
+    return {"slides": [
+        {
+            "type": "content_slide",
+            "title": f"Новый слайд {inputs.get('slide_index', 0) + i + 1}",
+            "content": [f"Тезис по инструкции «{instruction}»."],
+            "image_description": "Схема к новому слайду.",
+        }
+        for i in range(inputs.get("slide_count", 1))
+    ]}
+
+
+def generate_text(inputs: dict) -> str:
+    if "presentation" in inputs:
+        output = make_slides_patch(inputs)
+    else:
+        output = make_presentation(inputs.get("prompt", ""))
+    text = json.dumps(output, ensure_ascii=False)
+    if random.random() < config.malformed_rate:
+        # обрываем JSON посередине, как модель, упёршаяся в лимит токенов
+        return text[: len(text) // 2]
+    return text
+
+
+def first_token_delay() -> float:
+    """время до первого токена: логнормальное распределение с медианой latency_median"""
+    if config.latency_sigma <= 0:
+        return config.latency_median
+    return random.lognormvariate(math.log(config.latency_median), config.latency_sigma)
+
+
+def token_chunks(text: str):
+    """грубая разбивка на токены: около 4 символов на токен"""
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+async def simulate_generation(text: str):
+    await asyncio.sleep(first_token_delay())
+    if config.token_rate > 0:
+        await asyncio.sleep(len(token_chunks(text)) / config.token_rate)
+
+
+def injected_failure():
+    if random.random() < config.failure_rate:
+        return JSONResponse(status_code=500, content={"error": "injected failure"})
+    if random.random() < config.unavailable_rate:
+        return JSONResponse(status_code=503, content={"error": "injected unavailable"})
+    return None
+
+
+INFERENCE_HEADER = "Inference-Header-Content-Length"
+
+
+def read_infer_request(body: bytes, header_length):
+    """
+    (список входов по строкам батч-измерения, нужен ли бинарный выход)
+    из тела /infer, JSON или с бинарными тензорами
+    """
+    header = json.loads(body[:int(header_length)] if header_length is not None else body)
+    binary_output = any(o.get("parameters", {}).get("binary_data") for o in header.get("outputs", []))
+    offset = int(header_length or 0)
+    columns = {}
+    for tensor in header.get("inputs", []):
+        size = tensor.get("parameters", {}).get("binary_data_size")
+        if size is None:
+            columns[tensor["name"]] = tensor["data"]
+            continue
+        values, end = [], offset + size
+        while offset < end:
+            if tensor["datatype"] == "BYTES":
+                (length,) = struct.unpack_from("<I", body, offset)
+                values.append(body[offset + 4:offset + 4 + length].decode("utf-8"))
+                offset += 4 + length
+            else:
+                values.append(struct.unpack_from("<i", body, offset)[0])
+                offset += 4
+        columns[tensor["name"]] = values
+    rows = len(columns.get("prompt", [""]))
+    return [{name: values[i] for name, values in columns.items()} for i in range(rows)], binary_output
+
+
+def infer_response(model_name: str, texts: list, binary_output: bool) -> Response:
+    output = {"name": "generated_text", "datatype": "BYTES", "shape": [len(texts), 1]}
+    if not binary_output:
+        output["data"] = texts
+        return JSONResponse({"model_name": model_name, "model_version": "1", "outputs": [output]})
+    raw = b"".join(struct.pack("<I", len(data)) + data for data in (text.encode("utf-8") for text in texts))
+    output["parameters"] = {"binary_data_size": len(raw)}
+    header = json.dumps({"model_name": model_name, "model_version": "1", "outputs": [output]}).encode()
+    return Response(
+        content=header + raw,
+        media_type="application/octet-stream",
+        headers={INFERENCE_HEADER: str(len(header))},
+    )
+
+
+@app.get("/v2/health/live")
+@app.get("/v2/health/ready")
+@app.get("/v2/models/{model_name}/ready")
+async def health(model_name: str = None):
+    return {}
+
+
+@app.post("/v2/models/{model_name}/infer")
+async def infer(model_name: str, request: Request):
+    rows, binary_output = read_infer_request(await request.body(), request.headers.get(INFERENCE_HEADER))
+    failure = injected_failure()
+    if failure is not None:
+        return failure
+    texts = [generate_text(inputs) for inputs in rows]
+    # промпты одного запроса генерируются параллельно: ждём самый длинный
+    await simulate_generation(max(texts, key=len))
+    return infer_response(model_name, texts, binary_output)
+
+
+@app.post("/v2/models/{model_name}/generate")
+async def generate(model_name: str, request: Request):
+    body = await request.json()
+    failure = injected_failure()
+    if failure is not None:
+        return failure
+    text = generate_text(body)
+    await simulate_generation(text)
+    return {"model_name": model_name, "model_version": "1", "generated_text": text}
+
+
+@app.post("/v2/models/{model_name}/generate_stream")
+async def generate_stream(model_name: str, request: Request):
+    body = await request.json()
+    failure = injected_failure()
+    if failure is not None:
+        return failure
+    text = generate_text(body)
+
+    async def events():
+        await asyncio.sleep(first_token_delay())
+        for chunk in token_chunks(text):
+            event = {"model_name": model_name, "model_version": "1", "generated_text": chunk}
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if config.token_rate > 0:
+                await asyncio.sleep(1 / config.token_rate)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-median", type=float, default=1.0, help="медиана времени до первого токена, с")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="sigma логнормального распределения (0 - фиксированная)")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="токенов в секунду (0 - мгновенно)")
+    parser.add_argument("--slides", type=int, default=3, help="число информационных слайдов в ответе")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="доля ответов с некорректным JSON")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="доля запросов, завершающихся HTTP 500")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0,
+                        help="доля запросов, отклоняемых HTTP 503 до генерации (прокси повторяет их на другой реплике)")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    config = parse_args()
+    random.seed(config.seed)
+    uvicorn.run(app, host=config.host, port=config.port, log_level="warning")
@@ -0,0 +1,108 @@
+"""
+Нагрузочный тест /api/ai/generate-slides: держит заданное число одновременных запросов
+и печатает p50/p95/p99 задержки, запросы/с и распределение кодов ответа.
+
+    python bench/load_test.py --url http://127.0.0.1:8001 --concurrency 16 --requests 200
+
+С --max-p95 / --min-rps / --max-error-rate завершается с кодом 1 при нарушении порога (для CI).
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+
+PROMPTS = [
+    "3 слайда про строение атома для 8 класса",
+    "Презентация про фотосинтез для 6 класса",
+    "Сделай 4 слайда о дробях для 5 класса",
+    "Великая французская революция, 9 класс",
+]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def worker(client, args, counter, latencies, statuses):
+    while True:
+        i = next(counter, None)
+        if i is None:
+            return
+        prompt = PROMPTS[i % len(PROMPTS)]
+        if args.unique_prompts:
+            prompt = f"{prompt} (вариант {i})"
+        payload = {"prompt": prompt, "no_cache": args.no_cache}
+
+        started = time.perf_counter()
+        try:
+            response = await client.post(args.path, json=payload)
+            await response.aread()
+            statuses[response.status_code] += 1
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+
+
+async def run(args):
+    latencies, statuses = [], Counter()
+    counter = iter(range(args.requests))
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, args, counter, latencies, statuses) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return sorted(latencies), statuses, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8001")
+    parser.add_argument("--path", default="/api/ai/generate-slides")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--unique-prompts", action="store_true", help="делать промпты уникальными (мимо кэша результатов)")
+    parser.add_argument("--no-cache", action="store_true", help="передавать no_cache=true")
+    parser.add_argument("--max-p95", type=float, default=None, help="порог p95, с")
+    parser.add_argument("--min-rps", type=float, default=None, help="порог пропускной способности, запр/с")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="допустимая доля ответов не 200")
+    args = parser.parse_args()
+
+    latencies, statuses, elapsed = asyncio.run(run(args))
+    ok = len(latencies)
+    error_rate = 1 - ok / args.requests if args.requests else 0.0
+    rps = ok / elapsed if elapsed else 0.0
+    p50, p95, p99 = (percentile(latencies, q) for q in (50, 95, 99))
+
+    print(f"Запросов: {args.requests}, параллельно: {args.concurrency}, за {elapsed:.1f} с")
+    print(f"Успешных: {ok} ({rps:.2f} запр/с), доля ошибок: {error_rate:.1%}")
+    if latencies:
+        print(f"Задержка, с: p50={p50:.3f} p95={p95:.3f} p99={p99:.3f} "
+              f"среднее={statistics.mean(latencies):.3f} макс={latencies[-1]:.3f}")
+    print("Коды ответов: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str)))
+
+    failed = []
+    if args.max_p95 is not None and not p95 <= args.max_p95:
+        failed.append(f"p95 {p95:.3f} с > {args.max_p95} с")
+    if args.min_rps is not None and rps < args.min_rps:
+        failed.append(f"{rps:.2f} запр/с < {args.min_rps}")
+    if args.max_error_rate is not None and error_rate > args.max_error_rate:
+        failed.append(f"доля ошибок {error_rate:.1%} > {args.max_error_rate:.1%}")
+    if failed:
+        print("ПОРОГИ НАРУШЕНЫ: " + "; ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Микробенчмарк обработки ответа Triton в прокси на больших презентациях, без сети:
+время от тела HTTP-ответа Triton до байтов ответа клиенту.
+
+    python bench/proxy_path_benchmark.py --slides 10 50 200 --iterations 500
+
+Сравниваются:
+  json     - прежний путь: JSON-ответ generate разбирается json, текст модели разбирается
+             и проверяется pydantic, затем словарь сериализуется заново;
+  generate - generate-расширение: orjson для ответа Triton, одна проверка текста,
+             клиенту уходят те же байты;
+  binary   - /infer с бинарным расширением: разбирается только JSON-заголовок,
+             текст модели - срез тела, одна проверка, те же байты клиенту.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+import orjson
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from schemas import GENERATION_RESULT  # noqa: E402
+from triton_client import INFERENCE_HEADER, decode_binary_infer_response, validate_model_output  # noqa: E402
+
+
+def make_model_text(slides: int) -> str:
+    """текст модели: презентация из заданного числа слайдов с длинными тезисами"""
+    deck = [{"type": "title_slide", "title": "Строение атома", "subtitle": "Урок для 8 класса"}]
+    for i in range(slides):
+        deck.append({
+            "type": "content_slide",
+            "title": f"Часть {i + 1}: электронные оболочки",
+            "content": [f"Тезис №{j + 1}: электроны располагаются на оболочках вокруг ядра, "
+                        f"их число равно заряду ядра \"Z\"." for j in range(5)],
+            "image_description": f"Схема атома к слайду {i + 1}: ядро и электронные оболочки, подписи на русском.",
+        })
+    deck.append({"type": "final_slide", "title": "Итоги", "subtitle": "Спасибо за внимание!"})
+    return json.dumps({"title": "Строение атома", "slides": deck}, ensure_ascii=False)
+
+
+def make_generate_body(text: str) -> bytes:
+    return json.dumps({"model_name": "mixtral", "model_version": "1", "generated_text": text},
+                      ensure_ascii=False).encode("utf-8")
+
+
+def make_binary_body(text: str):
+    raw = text.encode("utf-8")
+    output = {"name": "generated_text", "datatype": "BYTES", "shape": [1, 1],
+              "parameters": {"binary_data_size": 4 + len(raw)}}
+    header = json.dumps({"model_name": "mixtral", "model_version": "1", "outputs": [output]}).encode()
+    return header + struct.pack("<I", len(raw)) + raw, {INFERENCE_HEADER: str(len(header))}
+
+
+def json_path(body: bytes) -> bytes:
+    text = json.loads(body)["generated_text"]
+    result = GENERATION_RESULT.dump_python(GENERATION_RESULT.validate_json(text))
+    return json.dumps(result, ensure_ascii=False).encode("utf-8")
+
+
+def generate_path(body: bytes) -> bytes:
+    return validate_model_output(orjson.loads(body)["generated_text"])
+
+
+def binary_path(body: bytes, headers: dict) -> bytes:
+    (text,) = decode_binary_infer_response(body, headers.get(INFERENCE_HEADER))
+    return validate_model_output(text)
+
+
+def measure(fn, iterations: int) -> float:
+    """среднее время одного вызова, мкс"""
+    fn()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slides", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'слайдов':>8} {'КБ':>7} {'json, мкс':>10} {'generate, мкс':>14} {'binary, мкс':>12} {'ускорение':>10}")
+    for slides in args.slides:
+        text = make_model_text(slides)
+        generate_body = make_generate_body(text)
+        binary_body, binary_headers = make_binary_body(text)
+        # все пути должны отдавать клиенту один и тот же документ
+        assert orjson.loads(json_path(generate_body)) == orjson.loads(binary_path(binary_body, binary_headers))
+
+        json_us = measure(lambda: json_path(generate_body), args.iterations)
+        generate_us = measure(lambda: generate_path(generate_body), args.iterations)
+        binary_us = measure(lambda: binary_path(binary_body, binary_headers), args.iterations)
+        print(f"{slides:>8} {len(text.encode()) / 1024:>7.1f} {json_us:>10.1f} {generate_us:>14.1f} "
+              f"{binary_us:>12.1f} {json_us / binary_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
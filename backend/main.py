@@ -1,56 +1,160 @@
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import tritonclient.http as httpclient
-import numpy as np
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+import asyncio
 import json
 import logging
 import os
+import time
+from typing import List
+import orjson
 from dotenv import load_dotenv
-import requests
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from triton_client import ModelOutputError, is_generation_error, validate_model_output
+from triton_router import TritonRouter
+from schemas import GenerationResult, Presentation
+from slides_stream import SlidesStreamParser
+from result_cache import ResultCache
+from scheduler import FairScheduler, QueueFullError
+from batch_jobs import BatchJobStore, TooManyJobsError
+from sessions import SessionStore
+import metrics
 
 
 load_dotenv()# переменные из .env файла в окружение
 TRITON_URL = os.getenv("TRITON_URL", "localhost:8000")
+# реплики Triton через запятую; без TRITON_URLS - одна реплика TRITON_URL
+TRITON_URLS = [url.strip() for url in os.getenv("TRITON_URLS", TRITON_URL).split(",") if url.strip()]
 APP_PORT = int(os.getenv("APP_PORT", 8001))
 MODEL_NAME = "mixtral"
+# таймауты и ограничения пула соединений к Triton (секунды / штуки)
+TRITON_REQUEST_TIMEOUT = float(os.getenv("TRITON_REQUEST_TIMEOUT", 300))
+TRITON_CONNECT_TIMEOUT = float(os.getenv("TRITON_CONNECT_TIMEOUT", 5))
+TRITON_MAX_CONNECTIONS = int(os.getenv("TRITON_MAX_CONNECTIONS", 16))
+TRITON_MAX_IN_FLIGHT = int(os.getenv("TRITON_MAX_IN_FLIGHT", 4))
+# протокол запросов к Triton: "generate" или "binary" (/infer с бинарными тензорами, модель с decoupled: false)
+TRITON_PROTOCOL = os.getenv("TRITON_PROTOCOL", "generate")
+# маршрутизация по репликам: попыток на запрос (повтор - только если запрос не дошёл до модели),
+# период и таймаут фоновой проверки готовности, ошибок подряд до размыкания предохранителя
+# и сколько секунд реплика с разомкнутым предохранителем не получает запросов
+TRITON_MAX_ATTEMPTS = int(os.getenv("TRITON_MAX_ATTEMPTS", 2))
+TRITON_PROBE_INTERVAL = float(os.getenv("TRITON_PROBE_INTERVAL", 5))
+TRITON_PROBE_TIMEOUT = float(os.getenv("TRITON_PROBE_TIMEOUT", 2))
+TRITON_BREAKER_FAILURES = int(os.getenv("TRITON_BREAKER_FAILURES", 5))
+TRITON_BREAKER_RESET = float(os.getenv("TRITON_BREAKER_RESET", 30))
+# кэш готовых презентаций: число записей в памяти, время жизни (с) и файл sqlite ("" - без диска)
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 1024))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 86400))
+# отказы модели (ambiguous_request и т.п.) зависят от сэмплирования: по умолчанию не кэшируются
+RESULT_CACHE_REFUSAL_TTL = float(os.getenv("RESULT_CACHE_REFUSAL_TTL", 0))
+RESULT_CACHE_DISK_PATH = os.getenv("RESULT_CACHE_DISK_PATH", "")
+# версия настроек модели в ключе кэша: её нужно менять вместе с параметрами генерации в config.pbtxt
+# (temperature, response_grammar, speculative...), файлом модели или системным промптом,
+# иначе до RESULT_CACHE_TTL будут отдаваться презентации, сгенерированные со старыми настройками
+RESULT_CACHE_VERSION = os.getenv("RESULT_CACHE_VERSION", "1")
+# очередь генераций: сколько запросов может ждать, сверх этого - 429
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", 32))
+# роль, запросы которой идут в приоритетной полосе
+PRIORITY_ROLE = os.getenv("PRIORITY_ROLE", "admin")
+# сессии: сколько секунд токен живёт с последнего использования и сколько сессий держать в памяти
+SESSION_TTL = float(os.getenv("SESSION_TTL", 43200))
+SESSION_MAX = int(os.getenv("SESSION_MAX", 10000))
+# как часто проверять, не закрыл ли браузер соединение во время генерации
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", 0.5))
+# пакетная генерация: промптов в пакете, одновременно генерируемых элементов (или пачек) одного пакета,
+# промптов в одном /infer (протокол binary, не больше max_batch_size модели),
+# одновременно выполняющихся пакетов и сколько секунд хранить завершённый пакет для дочитывания
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", 50))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 2))
+BATCH_TRITON_SIZE = int(os.getenv("BATCH_TRITON_SIZE", 4))
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", 8))
+BATCH_JOB_TTL = float(os.getenv("BATCH_JOB_TTL", 3600))
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+# httpx пишет каждый запрос на INFO, а фоновые проверки реплик идут раз в TRITON_PROBE_INTERVAL
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+#Triton: соединения не открываются при импорте, пул каждой реплики создаётся при первом запросе
+triton_client = TritonRouter(
+    urls=TRITON_URLS,
+    model_name=MODEL_NAME,
+    max_attempts=TRITON_MAX_ATTEMPTS,
+    probe_interval=TRITON_PROBE_INTERVAL,
+    probe_timeout=TRITON_PROBE_TIMEOUT,
+    failure_threshold=TRITON_BREAKER_FAILURES,
+    reset_timeout=TRITON_BREAKER_RESET,
+    request_timeout=TRITON_REQUEST_TIMEOUT,
+    connect_timeout=TRITON_CONNECT_TIMEOUT,
+    max_connections=TRITON_MAX_CONNECTIONS,
+    max_in_flight=TRITON_MAX_IN_FLIGHT,
+    protocol=TRITON_PROTOCOL,
+)
+
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    ttl=RESULT_CACHE_TTL,
+    disk_path=RESULT_CACHE_DISK_PATH or None,
+    version=RESULT_CACHE_VERSION,
+    ttl_of=lambda value: RESULT_CACHE_REFUSAL_TTL if is_generation_error(value) else RESULT_CACHE_TTL,
+)
+
+# TRITON_MAX_IN_FLIGHT - на реплику, очередь пропускает столько генераций, сколько вмещают все реплики
+scheduler = FairScheduler(max_concurrency=TRITON_MAX_IN_FLIGHT * len(TRITON_URLS), max_queue=QUEUE_MAX_SIZE)
+
+batch_jobs = BatchJobStore(max_active=BATCH_MAX_JOBS, ttl=BATCH_JOB_TTL)
 
+metrics.QUEUE_DEPTH.set_function(lambda: scheduler.depth)
+metrics.TRITON_IN_FLIGHT.set_function(lambda: triton_client.in_flight)
+metrics.BATCH_JOBS.set_function(lambda: batch_jobs.active)
 
-#Triton
-try:
-    triton_client = httpclient.InferenceServerClient(url=TRITON_URL)
-    if not triton_client.is_server_live():
-         raise ConnectionError("Triton server is not live")
-    logger.info(f"Успешное подключение к Triton Inference Server по адресу: {TRITON_URL}")
-except Exception as e:
-    logger.error(f"Не удалось подключиться к Triton Inference Server: {e}")
-    triton_client = None
-
-
-#база пользователей
-try:
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    users_file_path = os.path.join(base_dir, "users.json")
-    with open(users_file_path, "r", encoding="utf-8") as f:
-        users_db = json.load(f)
-    logger.info(f"База данных пользователей успешно загружена. Найдено пользователей: {len(users_db)}")
-except FileNotFoundError:
-    logger.error("Файл users.json не найден! Создайте его для работы авторизации.")
-    users_db = []
-except json.JSONDecodeError:
-    logger.error("Ошибка чтения users.json! Проверьте синтаксис файла.")
-    users_db = []
+
+#база пользователей: загружается при старте приложения (lifespan), а не при импорте модуля
+users_db = []
+
+
+def load_users() -> list:
+    try:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        users_file_path = os.path.join(base_dir, "users.json")
+        with open(users_file_path, "r", encoding="utf-8") as f:
+            users = json.load(f)
+        logger.info(f"База данных пользователей успешно загружена. Найдено пользователей: {len(users)}")
+        return users
+    except FileNotFoundError:
+        logger.error("Файл users.json не найден! Создайте его для работы авторизации.")
+    except json.JSONDecodeError:
+        logger.error("Ошибка чтения users.json! Проверьте синтаксис файла.")
+    return []
+
+#сессии: токен из /api/auth/login -> пользователь
+sessions = SessionStore(ttl=SESSION_TTL, max_sessions=SESSION_MAX)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global users_db
+    users_db = load_users()
+    # Triton не ждём: он может ещё загружать модель. Фоновые проверки подключаются к репликам
+    # с повторами, а пока ни одна не готова, /health/ready отвечает 503
+    triton_client.start()
+    yield
+    batch_jobs.cancel_all()
+    await triton_client.close()
+    result_cache.close()
 
 
 app = FastAPI(
     title="API для генерации презентаций",
     description="Прокси-сервер для модели на Triton Inference Server.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -67,6 +171,18 @@ app.add_middleware(
 
 class UserPrompt(BaseModel):
     prompt: str
+    no_cache: bool = False  # сгенерировать заново, не заглядывая в кэш
+
+class SlideEditRequest(BaseModel):
+    presentation: Presentation
+    slide_index: int = Field(ge=0)           # первый перегенерируемый слайд, нумерация с 0
+    slide_count: int = Field(default=1, ge=1)
+    instruction: str                         # что изменить, например "сделай проще для 5 класса"
+    no_cache: bool = False
+
+class BatchRequest(BaseModel):
+    prompts: List[str] = Field(min_length=1, max_length=BATCH_MAX_PROMPTS)
+    no_cache: bool = False
 
 class UserLogin(BaseModel):
     username: str
@@ -74,88 +190,108 @@ class UserLogin(BaseModel):
 
 class LoginResponse(BaseModel):
     role: str
+    token: str
 
 
-# def get_prediction_from_triton(prompt_text: str) -> dict:
-#     """
-#     Отправляет текстовый промпт в модель на сервере Triton и возвращает результат в виде словаря.
-#     """
-#     if not triton_client:
-#         raise ConnectionError("Клиент Triton не инициализирован. Проверьте подключение к серверу Triton.")
-
-#     try:
-#         logger.info(f"Подготовка запроса для Triton с промптом: '{prompt_text[:70]}...'")
-        
-#         prompt_tensor = httpclient.InferInput("prompt", [1], "BYTES")
-#         #prompt_tensor.set_data_from_numpy(np.array([prompt_text.encode('utf-8')], dtype=np.object_))
-
-#         prompt_tensor.set_data_from_numpy(np.array([prompt_text], dtype=np.object_))
-
-#         response = triton_client.infer(
-#             model_name=MODEL_NAME,
-#             inputs=[prompt_tensor]
-#         )
-
-#         result_bytes = response.as_numpy("generated_text")[0]
-#         result_json_str = result_bytes.decode('utf-8')
-
-#         result_data = json.loads(result_json_str)
-#         logger.info("[SUCCESS] Получен и обработан ответ от Triton.")
-#         return result_data
-
-#     except Exception as e:
-#         logger.error(f"Произошла ошибка во время обращения к Triton: {e}")
-#         raise e
-
-def get_prediction_from_triton(prompt_text: str) -> dict:
-    url = f"http://{TRITON_URL}/v2/models/{MODEL_NAME}/infer"
-
-    payload = {
-        "inputs": [
-            {
-                "name": "prompt",
-                "shape": [1],
-                "datatype": "BYTES",
-                "data": [prompt_text]
-            }
-        ]
-    }
-    headers = {
-        'Content-Type': 'application/json'
-    }
+class ClientDisconnected(Exception):
+    """браузер закрыл соединение, пока запрос ещё обрабатывался"""
 
+
+async def cancel_on_disconnect(http_request: Request, coro):
+    """
+    выполняет корутину, периодически проверяя соединение с браузером.
+    если клиент ушёл - корутина отменяется (вместе с запросом к Triton)
+    """
+    task = asyncio.ensure_future(coro)
     try:
-        logger.info(f"Отправка ручного запроса на {url} с промптом: '{prompt_text[:70]}...'")
-        
-        json_payload = json.dumps(payload, ensure_ascii=False)
-        data_payload = json_payload.encode('utf-8')
-        response = requests.post(url, headers=headers, data=data_payload)
-        response.raise_for_status()
-        triton_response_data = response.json()
-        output_data = None
-        for output in triton_response_data.get('outputs', []):
-            if output['name'] == 'generated_text':
-                output_data = output['data'][0]
-                break
-        
-        if output_data is None:
-            logger.error(f"В ответе от Triton не найден output с именем 'generated_text'. Ответ: {triton_response_data}")
-            raise ValueError("Не найден ожидаемый output в ответе от Triton")
-
-        result_data = json.loads(output_data)
-        logger.info("[SUCCESS] Получен и обработан ответ от Triton (ручной режим, UTF-8).")
-        return result_data
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Ошибка сети при обращении к Triton: {e}")
-        raise ConnectionError(f"Ошибка сети при обращении к Triton: {e}")
-    except json.JSONDecodeError as e:
-        logger.error(f"Ошибка декодирования JSON от Triton. Ответ модели (если был получен): '{output_data}'")
-        logger.error(f"Детали ошибки: {e}")
-        raise HTTPException(status_code=500, detail="Модель вернула некорректный JSON.")
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Клиент отключился, запрос к Triton отменён.")
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def sse_event(event: str, data) -> bytes:
+    """одно событие Server-Sent Events"""
+    started = time.perf_counter()
+    body = orjson.dumps(data)
+    metrics.RESPONSE_SERIALIZATION.observe(time.perf_counter() - started)
+    return sse_raw_event(event, body)
+
+
+def sse_raw_event(event: str, body: bytes) -> bytes:
+    """событие с готовым JSON; переносы строк внутри JSON - пробелы, их разносим по строкам data:"""
+    data = b"".join(b"data: " + line + b"\n" for line in body.split(b"\n"))
+    return b"event: " + event.encode() + b"\n" + data + b"\n"
+
+
+def get_current_user(http_request: Request, authorization: str = Header(None)) -> dict:
+    """
+    пользователь по токену из /api/auth/login; без токена - аноним, различаемый по IP.
+    неизвестный или истёкший токен (например, после перезапуска сервера) - 401, а не аноним:
+    иначе все пользователи за одним NAT молча попали бы в одну полосу очереди
+    """
+    if authorization and authorization.startswith("Bearer "):
+        user = sessions.get(authorization[len("Bearer "):])
+        if user is None:
+            raise HTTPException(
+                status_code=401,
+                detail="Сессия истекла или недействительна, войдите заново",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return user
+    client_host = http_request.client.host if http_request.client else "unknown"
+    return {"username": f"anonymous:{client_host}", "role": "guest"}
+
+
+@asynccontextmanager
+async def generation_slot(user: dict, weight: int = 1):
+    """место (weight мест - для пачки промптов) в очереди генерации для пользователя; время ожидания уходит в метрики"""
+    started = time.perf_counter()
+    async with scheduler.slot(user["username"], priority=user["role"] == PRIORITY_ROLE, weight=weight):
+        metrics.QUEUE_WAIT.observe(time.perf_counter() - started)
+        yield
+
+
+def queue_full_exception(e: QueueFullError) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def cached_generation(http_request: Request, cache_key: str, compute, bypass: bool) -> Response:
+    """
+    генерация через кэш результатов (одинаковые запросы ждут одну общую) с отменой при уходе клиента;
+    ошибки превращаются в HTTP-коды, готовые байты JSON уходят клиенту как есть
+    """
+    try:
+        generated_data, cache_status = await cancel_on_disconnect(
+            http_request,
+            result_cache.get_or_compute(cache_key, compute, bypass=bypass),
+        )
+    except ClientDisconnected:
+        metrics.ERRORS.labels("client_disconnected").inc()
+        # отвечать уже некому, 499 - как у nginx для закрытого клиентом запроса
+        return Response(status_code=499)
+    except QueueFullError as e:
+        metrics.ERRORS.labels("queue_full").inc()
+        raise queue_full_exception(e)
+    except ConnectionError as e:
+        metrics.ERRORS.labels("triton_unavailable").inc()
+        raise HTTPException(status_code=503, detail=f"Сервис временно недоступен: {str(e)}")
+    except ModelOutputError as e:
+        metrics.ERRORS.labels("model_output").inc()
+        raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
-        logger.error(f"Произошла непредвиденная ошибка во время обращения к Triton: {e}")
-        raise e
+        metrics.ERRORS.labels("internal").inc()
+        raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
+
+    logger.info(f"Кэш результатов: {cache_status}")
+    metrics.CACHE_RESULTS.labels(cache_status).inc()
+    return Response(content=generated_data, media_type="application/json", headers={"X-Cache": cache_status})
 
 
 #эндпоинты API 
@@ -170,7 +306,8 @@ async def login_for_user(request: UserLogin):
     for user in users_db:
         if user["username"] == request.username and user["password"] == request.password:
             logger.info(f"Успешный вход для пользователя {request.username}. Роль: {user['role']}")
-            return {"role": user["role"]}
+            token = sessions.create({"username": user["username"], "role": user["role"]})
+            return {"role": user["role"], "token": token}
 
     logger.warning(f"Неудачная попытка входа для пользователя: {request.username}")
     raise HTTPException(
@@ -179,27 +316,366 @@ async def login_for_user(request: UserLogin):
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-@app.post("/api/ai/generate-slides")
-async def generate_slides(request: UserPrompt):
+
+@app.post("/api/auth/logout", status_code=204)
+async def logout(authorization: str = Header(None)):
+    """завершает сессию: токен из заголовка Authorization больше не действует"""
+    if authorization and authorization.startswith("Bearer "):
+        sessions.revoke(authorization[len("Bearer "):])
+    return Response(status_code=204)
+
+
+@app.post("/api/ai/generate-slides", response_model=GenerationResult)
+async def generate_slides(
+    request: UserPrompt,
+    http_request: Request,
+    user: dict = Depends(get_current_user),
+):
     """
-    принимаю промпт, отправляю его модели и она возвращает сгенерированный json
+    принимаю промпт, отправляю его модели и она возвращает сгенерированный json.
+    одинаковые промпты берутся из кэша, а одновременные - ждут одну общую генерацию.
+    до модели запрос доходит через очередь с честным обходом пользователей.
+    проверенный по схеме текст модели уходит клиенту теми же байтами, без пересериализации
     """
-    logger.info(f"Получен запрос на /generate/ с промптом: '{request.prompt}'")
+    logger.info(f"Получен запрос на /generate/ от {user['username']} с промптом: '{request.prompt}'")
+    cache_key = result_cache.make_key(request.prompt, MODEL_NAME)
+
+    async def generate():
+        async with generation_slot(user):
+            return await triton_client.infer(request.prompt)
+
+    with metrics.track_request("generate"):
+        return await cached_generation(http_request, cache_key, generate, bypass=request.no_cache)
+
+
+@app.post("/api/ai/regenerate-slides", response_model=Presentation)
+async def regenerate_slides(
+    request: SlideEditRequest,
+    http_request: Request,
+    user: dict = Depends(get_current_user),
+):
+    """
+    перегенерирую только выбранные слайды готовой презентации по инструкции учителя.
+    модель видит презентацию компактно (план + заменяемые слайды) и пишет лишь новые слайды,
+    поэтому правка одного слайда стоит примерно один слайд выходных токенов.
+    возвращаю всю презентацию с заменёнными слайдами
+    """
+    slides_total = len(request.presentation.slides)
+    if request.slide_index + request.slide_count > slides_total:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Слайды {request.slide_index}..{request.slide_index + request.slide_count - 1} "
+                   f"вне презентации из {slides_total} слайдов",
+        )
+    logger.info(
+        f"Получен запрос на /regenerate-slides/ от {user['username']}: слайды с {request.slide_index} "
+        f"({request.slide_count} шт.), инструкция: '{request.instruction}'"
+    )
+    deck = request.presentation.model_dump()
+    deck_json = orjson.dumps(deck)
+    cache_key = result_cache.make_key(request.instruction, MODEL_NAME, {
+        "presentation": deck_json.decode("utf-8"),
+        "slide_index": request.slide_index,
+        "slide_count": request.slide_count,
+    })
+
+    async def regenerate():
+        async with generation_slot(user):
+            new_slides = await triton_client.regenerate_slides(
+                request.instruction, deck_json, request.slide_index, request.slide_count,
+            )
+        deck["slides"][request.slide_index:request.slide_index + request.slide_count] = new_slides
+        started = time.perf_counter()
+        body = orjson.dumps(deck)
+        metrics.RESPONSE_SERIALIZATION.observe(time.perf_counter() - started)
+        return body
+
+    with metrics.track_request("regenerate"):
+        return await cached_generation(http_request, cache_key, regenerate, bypass=request.no_cache)
+
+
+@app.post("/api/ai/generate-slides/stream")
+async def generate_slides_stream(request: UserPrompt, user: dict = Depends(get_current_user)):
+    """
+    потоковая генерация (Server-Sent Events).
+    событие slide приходит, как только модель дописала очередной слайд,
+    в конце - done с полной презентацией или error
+    """
+    logger.info(f"Получен запрос на /generate/stream от {user['username']} с промптом: '{request.prompt}'")
+
+    cache_key = result_cache.make_key(request.prompt, MODEL_NAME)
+    cached = await result_cache.lookup(cache_key, bypass=request.no_cache)
+    metrics.CACHE_RESULTS.labels("BYPASS" if request.no_cache else "HIT" if cached is not None else "MISS").inc()
+    if cached is None and scheduler.is_full():
+        metrics.ERRORS.labels("queue_full").inc()
+        raise queue_full_exception(QueueFullError(scheduler.retry_after()))
+
+    async def event_stream():
+        with metrics.track_request("generate_stream"):
+            events = stream_events()
+            try:
+                async for event in events:
+                    yield event
+            except (asyncio.CancelledError, GeneratorExit):
+                # браузер закрыл поток - считаем так же, как отключение в /generate-slides
+                metrics.ERRORS.labels("client_disconnected").inc()
+                raise
+            finally:
+                # генерация (и запрос к Triton) останавливается сразу, а не когда сборщик дойдёт до генератора
+                await events.aclose()
+
+    async def stream_events():
+        if cached is not None:
+            for index, slide in enumerate(orjson.loads(cached).get("slides", [])):
+                yield sse_event("slide", {"index": index, "slide": slide})
+            yield sse_raw_event("done", cached)
+            return
+
+        parser = SlidesStreamParser()
+        index = 0
+        try:
+            async with generation_slot(user):
+                async for chunk in triton_client.infer_stream(request.prompt):
+                    for slide in parser.feed(chunk):
+                        yield sse_event("slide", {"index": index, "slide": slide})
+                        index += 1
+            result = validate_model_output(parser.text)
+            result_cache.set(cache_key, result)
+            yield sse_raw_event("done", result)
+        except ConnectionError as e:
+            metrics.ERRORS.labels("triton_unavailable").inc()
+            yield sse_event("error", {"detail": f"Сервис временно недоступен: {str(e)}"})
+        except ModelOutputError as e:
+            metrics.ERRORS.labels("model_output").inc()
+            yield sse_event("error", {"detail": str(e)})
+        except json.JSONDecodeError as e:
+            # очередной слайд в потоке - не JSON
+            metrics.ERRORS.labels("model_output").inc()
+            yield sse_event("error", {"detail": f"Модель вернула некорректный слайд: {str(e)}"})
+        except QueueFullError as e:
+            metrics.ERRORS.labels("queue_full").inc()
+            yield sse_event("error", {"detail": str(e)})
+        except Exception as e:
+            # заголовки уже отправлены, поэтому о любой другой ошибке клиент узнаёт событием error
+            logger.exception("Ошибка потоковой генерации")
+            metrics.ERRORS.labels("internal").inc()
+            yield sse_event("error", {"detail": f"Внутренняя ошибка сервера: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def batch_item_line(index: int, data: bytes, cache_status: str) -> bytes:
+    """строка NDJSON с готовой презентацией; её JSON вставляется как есть"""
+    # переводы строк в JSON модели - только пробелы между токенами, а в NDJSON они разделяют записи
+    data = data.replace(b"\r", b" ").replace(b"\n", b" ")
+    return b'{"index":%d,"status":"ok","cache":"%s","result":%s}\n' % (index, cache_status.encode(), data)
+
+
+def batch_item_error(index: int, e: Exception) -> dict:
+    """запись об ошибке элемента пакета: код и тип - как у /api/ai/generate-slides"""
+    if isinstance(e, ConnectionError):
+        code, error_type, detail = 503, "triton_unavailable", f"Сервис временно недоступен: {str(e)}"
+    elif isinstance(e, ModelOutputError):
+        code, error_type, detail = 500, "model_output", str(e)
+    else:
+        code, error_type, detail = 500, "internal", f"Внутренняя ошибка сервера: {str(e)}"
+    metrics.ERRORS.labels(error_type).inc()
+    return {"index": index, "status": "error", "code": code, "error": error_type, "detail": detail}
+
+
+async def in_batch_slot(user: dict, call, weight: int = 1):
+    """вызов модели через общую очередь; при переполнении очереди пакет ждёт, а не получает отказ"""
+    while True:
+        try:
+            async with generation_slot(user, weight):
+                return await call()
+        except QueueFullError as e:
+            await asyncio.sleep(e.retry_after)
+
+
+async def run_batch(job, prompts: list, user: dict, no_cache: bool):
+    """
+    генерирует презентации пакета, одновременно - не больше BATCH_CONCURRENCY элементов,
+    и складывает каждую в задание, как только она готова. ошибка элемента не останавливает пакет.
+    с протоколом binary промпты уходят в Triton пачками по BATCH_TRITON_SIZE одним /infer
+    (батч-измерение входа prompt), иначе - по одному через кэш с объединением одинаковых запросов
+    """
+    keys = [result_cache.make_key(prompt, MODEL_NAME) for prompt in prompts]
+    fan_out = asyncio.Semaphore(BATCH_CONCURRENCY)
+    counts = {"succeeded": 0, "failed": 0}
+    cancelled = False
+
+    def record(index, result, cache_status):
+        if isinstance(result, Exception):
+            counts["failed"] += 1
+            job.add(batch_item_error(index, result))
+        else:
+            counts["succeeded"] += 1
+            metrics.CACHE_RESULTS.labels(cache_status).inc()
+            job.add_line(batch_item_line(index, result, cache_status))
+
+    async def run_one(index):
+        async with fan_out:
+            try:
+                result, cache_status = await result_cache.get_or_compute(
+                    keys[index],
+                    lambda: in_batch_slot(user, lambda: triton_client.infer(prompts[index])),
+                    bypass=no_cache,
+                )
+            except Exception as e:
+                result, cache_status = e, None
+            record(index, result, cache_status)
+
+    async def run_chunk(indexes):
+        async with fan_out:
+            # одинаковые промпты пачки генерируются один раз: ключ кэша -> номера элементов
+            pending = {}
+            for index in indexes:
+                cached = await result_cache.lookup(keys[index], bypass=no_cache)
+                if cached is not None:
+                    record(index, cached, "HIT")
+                else:
+                    pending.setdefault(keys[index], []).append(index)
+            if not pending:
+                return
+            unique = [same[0] for same in pending.values()]
+            try:
+                # пачка занимает в очереди по месту на промпт, как и те же промпты по одному
+                results = await in_batch_slot(
+                    user, lambda: triton_client.infer_batch([prompts[index] for index in unique]), weight=len(unique)
+                )
+            except Exception as e:
+                results = [e] * len(unique)
+            for same, result in zip(pending.values(), results):
+                if not isinstance(result, Exception):
+                    result_cache.set(keys[same[0]], result)
+                record(same[0], result, "BYPASS" if no_cache else "MISS")
+                for index in same[1:]:
+                    record(index, result, "COALESCED")
+
     try:
-        generated_data = get_prediction_from_triton(request.prompt)
-        return generated_data
-    except ConnectionError as e:
-        raise HTTPException(status_code=503, detail=f"Сервис временно недоступен: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
+        if triton_client.protocol == "binary" and BATCH_TRITON_SIZE > 1:
+            chunks = [range(i, min(i + BATCH_TRITON_SIZE, len(prompts))) for i in range(0, len(prompts), BATCH_TRITON_SIZE)]
+            await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+        else:
+            await asyncio.gather(*(run_one(index) for index in range(len(prompts))))
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
+    finally:
+        logger.info(f"Пакет {job.id}: готово {counts['succeeded']}, ошибок {counts['failed']}, отменён: {cancelled}")
+        job.finish({"done": True, "job_id": job.id, **counts, "cancelled": cancelled})
+
+
+def batch_stream_response(job, offset: int) -> StreamingResponse:
+    async def lines():
+        with metrics.track_request("batch"):
+            async for line in job.stream(offset):
+                yield line
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"X-Job-Id": job.id, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/ai/generate-slides/batch")
+async def generate_slides_batch(request: BatchRequest, user: dict = Depends(get_current_user)):
+    """
+    пакетная генерация (NDJSON): первая строка - {"job_id", "total"}, дальше по строке на каждую
+    готовую презентацию в порядке готовности ({"index", "status": "ok", "cache", "result"}
+    или {"index", "status": "error", "code", "error", "detail"}), последняя - {"done": true, ...}.
+    пакет выполняется независимо от соединения: после обрыва его можно дочитать по job_id
+    """
+    logger.info(f"Получен пакет из {len(request.prompts)} промптов от {user['username']}")
+    try:
+        job = batch_jobs.create(user["username"], len(request.prompts))
+    except TooManyJobsError as e:
+        metrics.ERRORS.labels("queue_full").inc()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(scheduler.retry_after())})
+
+    job.add({"job_id": job.id, "total": job.total})
+    job.task = asyncio.ensure_future(run_batch(job, request.prompts, user, request.no_cache))
+    return batch_stream_response(job, 0)
+
+
+@app.get("/api/ai/generate-slides/batch/{job_id}")
+async def resume_slides_batch(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    user: dict = Depends(get_current_user),
+):
+    """дочитать пакет после обрыва: offset - сколько строк NDJSON клиент уже получил"""
+    job = batch_jobs.get(job_id, user["username"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Пакетное задание не найдено")
+    return batch_stream_response(job, offset)
+
+
+@app.delete("/api/ai/generate-slides/batch/{job_id}")
+async def cancel_slides_batch(job_id: str, user: dict = Depends(get_current_user)):
+    """отменить пакет: уже готовые презентации остаются доступны для дочитывания"""
+    job = batch_jobs.get(job_id, user["username"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Пакетное задание не найдено")
+    if not job.done:
+        job.task.cancel()
+    return {"job_id": job.id, "cancelled": not job.done}
+
+
+@app.get("/api/ai/cache/stats")
+async def cache_stats():
+    """счётчики кэша результатов: попадания, промахи, объединённые запросы"""
+    return {**result_cache.stats, "entries": len(result_cache)}
+
+
+@app.get("/api/ai/queue")
+async def queue_status(user: dict = Depends(get_current_user)):
+    """глубина очереди и оценка ожидания - для опроса с фронтенда"""
+    position = scheduler.position_of(user["username"])
+    return {
+        **scheduler.snapshot(),
+        # false - запросов пользователя в очереди нет (например, его генерация уже идёт)
+        "waiting": scheduler.is_waiting(user["username"]),
+        "position": position,
+        "your_estimated_wait_seconds": round(scheduler.estimated_wait(position), 1),
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """метрики в формате Prometheus: задержки по этапам, запросы в обработке, ошибки"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/api/ai/triton/replicas")
+async def triton_replicas():
+    """реплики Triton: здоровье, предохранители, нагрузка и последние решения маршрутизации"""
+    return triton_client.snapshot()
+
+
+@app.get("/health/live")
+async def liveness_check():
+    """liveness: процесс отвечает; от Triton не зависит, чтобы оркестратор не перезапускал прокси из-за модели"""
+    return {"status": "ok"}
 
 
 @app.get("/health/")
+@app.get("/health/ready")
 async def health_check():
-    """эндпоинт для проверки, что сервер жив и может подключиться к Triton"""
-    if not triton_client or not triton_client.is_server_live():
-        raise HTTPException(status_code=503, detail="Не удалось подключиться к Triton Inference Server.")
-    return {"status": "ok", "triton_connection": "live"}
+    """
+    readiness: хотя бы одна реплика Triton готова принимать запросы;
+    отвечает по результатам фоновой проверки, не обращаясь к Triton
+    """
+    healthy = triton_client.healthy_count
+    if not healthy:
+        raise HTTPException(status_code=503, detail="Нет доступных реплик Triton Inference Server.")
+    return {"status": "ok", "triton_connection": "live", "replicas_ready": healthy, "replicas_total": len(triton_client.replicas)}
 
 
 #запуск сервера fastapi
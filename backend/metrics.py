@@ -0,0 +1,59 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# границы корзин: от миллисекунд (разбор ответа) до минут (генерация Mixtral)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_LATENCY = Histogram(
+    "slides_stage_latency_seconds",
+    "Время этапов обработки запроса на генерацию",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_LATENCY = Histogram(
+    "slides_request_latency_seconds",
+    "Полное время обработки запроса по эндпоинтам",
+    ["endpoint"],
+    buckets=STAGE_BUCKETS,
+)
+IN_FLIGHT = Gauge("slides_in_flight_requests", "Запросы в обработке", ["endpoint"])
+ERRORS = Counter("slides_errors_total", "Ошибки по типам", ["type"])
+CACHE_RESULTS = Counter("slides_cache_results_total", "Обращения к кэшу результатов по исходу", ["status"])
+QUEUE_DEPTH = Gauge("slides_queue_depth", "Запросы, ожидающие в очереди генерации")
+TRITON_IN_FLIGHT = Gauge("slides_triton_in_flight", "Запросы, выполняющиеся в Triton")
+BATCH_JOBS = Gauge("slides_batch_jobs_active", "Выполняющиеся пакетные задания")
+# проверка вывода модели по схеме: доля не-valid - это доля запросов, которые придётся повторить
+MODEL_OUTPUTS = Counter("slides_model_outputs_total", "Ответы модели по результату проверки схемы", ["result"])
+# маршрутизация по репликам Triton
+TRITON_ROUTED = Counter("slides_triton_requests_total", "Запросы к репликам Triton по исходу", ["replica", "outcome"])
+TRITON_REPLICA_HEALTHY = Gauge("slides_triton_replica_healthy", "Реплика прошла фоновую проверку готовности", ["replica"])
+TRITON_REPLICA_BREAKER = Gauge(
+    "slides_triton_replica_breaker_state", "Предохранитель реплики: 0 - closed, 1 - half_open, 2 - open", ["replica"]
+)
+
+# заранее созданные дочерние метрики этапов: на горячем пути нет поиска по меткам
+QUEUE_WAIT = STAGE_LATENCY.labels("queue_wait")
+TRITON_ROUNDTRIP = STAGE_LATENCY.labels("triton_roundtrip")
+MODEL_JSON_DECODE = STAGE_LATENCY.labels("model_json_decode")
+# сериализация на стороне прокси: пересобранная презентация /regenerate-slides и события SSE
+# (ответ /generate-slides уходит байтами модели и сюда не попадает)
+RESPONSE_SERIALIZATION = STAGE_LATENCY.labels("response_serialization")
+MODEL_OUTPUT_VALID = MODEL_OUTPUTS.labels("valid")
+MODEL_OUTPUT_INVALID_JSON = MODEL_OUTPUTS.labels("invalid_json")
+MODEL_OUTPUT_INVALID_SCHEMA = MODEL_OUTPUTS.labels("invalid_schema")
+
+
+@contextmanager
+def track_request(endpoint: str):
+    """считает запрос в обработке и наблюдает его полное время"""
+    in_flight = IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+        in_flight.dec()
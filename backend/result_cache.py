@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """приводит промпт к каноническому виду: регистр, юникод, лишние пробелы и точка в конце"""
+    text = unicodedata.normalize("NFKC", prompt).casefold().replace("ё", "е")
+    return " ".join(text.split()).rstrip(" .!")
+
+
+class ResultCache:
+    """
+    Кэш сгенерированных презентаций (готовые байты JSON-ответа):
+    LRU в памяти с TTL и необязательное хранилище на диске (sqlite),
+    которое переживает перезапуск. Одинаковые запросы, пришедшие одновременно,
+    ждут один общий вызов модели (single-flight).
+    sqlite работает в отдельном потоке: чтение с диска ожидается асинхронно,
+    запись уходит в фон и не задерживает ответ.
+    version входит в каждый ключ: смена версии (другие параметры генерации, файл модели,
+    системный промпт) делает недоступными все прежние записи, в том числе на диске.
+    """
+    def __init__(
+        self, max_entries: int = 1024, ttl: float = 86400.0, disk_path: str = None, version: str = "", ttl_of=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = version
+        # ttl_of(value) - срок жизни конкретного значения вместо ttl; 0 - значение не кэшируется
+        self.ttl_of = ttl_of
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._in_flight = {}            # key -> [task, число ожидающих]
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "disk_hits": 0, "bypass": 0}
+        self._db = None
+        self._disk = None
+        if disk_path:
+            # один поток на все обращения к sqlite: соединение не делится между потоками
+            self._disk = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-cache")
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            # WAL + synchronous=NORMAL: коммит без fsync на каждую запись, база не портится при сбое
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._db.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+            logger.info(f"Кэш результатов на диске: {disk_path}")
+
+    def make_key(self, prompt: str, model_name: str, params: dict = None) -> str:
+        """ключ кэша: нормализованный промпт + модель + версия её настроек + параметры запроса"""
+        raw = json.dumps(
+            [normalize_prompt(prompt), model_name, self.version, params or {}], ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _get_memory(self, key: str, now: float):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+        return None
+
+    async def get(self, key: str):
+        """значение из памяти или с диска; None, если его нет или срок истёк"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+
+        if self._db is not None:
+            row = await asyncio.get_running_loop().run_in_executor(self._disk, self._disk_get, key, now)
+            if row is not None:
+                # старые записи хранились текстом
+                value = row[0].encode("utf-8") if isinstance(row[0], str) else row[0]
+                self._remember(key, value, row[1])
+                self.stats["disk_hits"] += 1
+                return value
+        return None
+
+    async def lookup(self, key: str, bypass: bool = False):
+        """get() с учётом в счётчиках попаданий/промахов; при bypass кэш не читается"""
+        if bypass:
+            self.stats["bypass"] += 1
+            return None
+        value = await self.get(key)
+        self.stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, key: str, value: bytes):
+        """запоминает значение; на диск оно пишется в фоне"""
+        ttl = self.ttl if self.ttl_of is None else self.ttl_of(value)
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._remember(key, value, expires_at)
+        if self._db is not None:
+            self._disk.submit(self._disk_set, key, value, expires_at).add_done_callback(self._log_disk_error)
+
+    def _disk_get(self, key: str, now: float):
+        return self._db.execute(
+            "SELECT value, expires_at FROM results WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+
+    def _disk_set(self, key: str, value: bytes, expires_at: float):
+        self._db.execute(
+            "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at),
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _log_disk_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Не удалось записать результат в кэш на диске: {future.exception()!r}")
+
+    def _remember(self, key: str, value, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: str, compute, bypass: bool = False):
+        """
+        Возвращает (значение, статус), где статус - "HIT", "MISS", "COALESCED" или "BYPASS".
+        compute - функция без аргументов, возвращающая корутину с вызовом модели.
+        Вызов модели отменяется, только если от него отказались все ожидающие запросы.
+        """
+        if bypass:
+            self.stats["bypass"] += 1
+            value = await compute()
+            self.set(key, value)
+            return value, "BYPASS"
+
+        value = await self.get(key)
+        if value is None:
+            # пока читали диск, такой же запрос мог успеть сгенерировать и сохранить значение
+            value = self._get_memory(key, time.time())
+        if value is not None:
+            self.stats["hits"] += 1
+            return value, "HIT"
+
+        flight = self._in_flight.get(key)
+        if flight is not None and (flight[0].cancelling() or flight[0].cancelled()):
+            # от вызова уже отказались, и он сворачивается - к нему не присоединяемся
+            flight = None
+        if flight is None:
+            self.stats["misses"] += 1
+            status = "MISS"
+            flight = [asyncio.ensure_future(self._compute_and_store(key, compute)), 0]
+            self._in_flight[key] = flight
+        else:
+            self.stats["coalesced"] += 1
+            status = "COALESCED"
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task), status
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not task.done():
+                # убираем вызов из _in_flight сразу: пока задача сворачивается, такой же
+                # новый запрос должен начать свой вызов, а не получить CancelledError
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+                task.cancel()
+
+    async def _compute_and_store(self, key: str, compute):
+        try:
+            value = await compute()
+            self.set(key, value)
+            return value
+        finally:
+            # под этим ключом уже может выполняться новый вызов - удаляем только свой
+            flight = self._in_flight.get(key)
+            if flight is not None and flight[0] is asyncio.current_task():
+                del self._in_flight[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        if self._db is not None:
+            # дожидаемся фоновых записей
+            self._disk.shutdown(wait=True)
+            self._db.close()
+            self._db = None
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """очередь переполнена; retry_after - через сколько секунд имеет смысл повторить"""
+    def __init__(self, retry_after: int):
+        super().__init__(f"Очередь генерации переполнена, повторите через {retry_after} с")
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    """
+    Допуск запросов к модели: не больше max_concurrency генераций одновременно
+    и не больше max_queue ожидающих. Ожидающие обслуживаются по кругу между
+    пользователями (один пользователь с десятком запросов не задерживает остальных),
+    а запросы из приоритетной полосы (администраторы) - раньше всех.
+    Запрос с weight > 1 (пачка промптов в одном вызове модели) занимает weight мест сразу.
+    """
+    def __init__(self, max_concurrency: int, max_queue: int, initial_service_time: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self._priority = deque()          # (future, weight, пользователь) приоритетной полосы
+        self._by_user = OrderedDict()     # пользователь -> deque (future, weight, пользователь), порядок = очередь обхода
+        self._depth = 0
+        # скользящее среднее длительности генерации, для оценки ожидания
+        self.avg_service_time = initial_service_time
+        self.stats = {"admitted": 0, "rejected": 0, "cancelled": 0}
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def estimated_wait(self, position: int = None) -> float:
+        """оценка ожидания (с) для запроса на позиции position (по умолчанию - в конце очереди)"""
+        if position is None:
+            position = self._depth
+        if self.running < self.max_concurrency and position == 0:
+            return 0.0
+        waves = position // self.max_concurrency + 1
+        return waves * self.avg_service_time
+
+    def is_waiting(self, user: str) -> bool:
+        """есть ли у пользователя запрос, который ещё ждёт места"""
+        return user in self._by_user or any(entry[2] == user for entry in self._priority)
+
+    def position_of(self, user: str) -> int:
+        """сколько запросов будет обслужено раньше первого запроса пользователя (приблизительно)"""
+        for index, entry in enumerate(self._priority):
+            if entry[2] == user:
+                return index
+        if user not in self._by_user:
+            return self._depth
+        # при обходе по кругу до пользователя дойдут после приоритетных и по одному от тех, кто перед ним
+        return len(self._priority) + list(self._by_user).index(user)
+
+    def is_full(self) -> bool:
+        """новый запрос сейчас получил бы отказ"""
+        return self.running >= self.max_concurrency and self._depth >= self.max_queue
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.estimated_wait()))
+
+    @asynccontextmanager
+    async def slot(self, user: str, priority: bool = False, weight: int = 1):
+        """
+        занимает weight мест для генерации на время блока (сразу все, не больше max_concurrency);
+        бросает QueueFullError, если очередь полна
+        """
+        weight = max(1, min(weight, self.max_concurrency))
+        await self._acquire(user, priority, weight)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * elapsed
+            self._release(weight)
+
+    async def _acquire(self, user: str, priority: bool, weight: int):
+        if self.running + weight <= self.max_concurrency and self._depth == 0:
+            self.running += weight
+            self.stats["admitted"] += 1
+            return
+
+        if self._depth >= self.max_queue:
+            self.stats["rejected"] += 1
+            retry_after = self.retry_after()
+            logger.warning(f"Очередь переполнена ({self._depth}), отказ пользователю {user}, Retry-After={retry_after}")
+            raise QueueFullError(retry_after)
+
+        entry = (asyncio.get_running_loop().create_future(), weight, user)
+        if priority:
+            self._priority.append(entry)
+        else:
+            self._by_user.setdefault(user, deque()).append(entry)
+        self._depth += 1
+
+        future = entry[0]
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # место уже выдано, но клиент ушёл - отдаём его следующему
+                self._release(weight)
+            else:
+                self._remove(entry, user, priority)
+            self.stats["cancelled"] += 1
+            raise
+        self.stats["admitted"] += 1
+
+    def _remove(self, entry, user: str, priority: bool):
+        self._depth -= 1
+        waiting = self._priority if priority else self._by_user.get(user)
+        if waiting is not None and entry in waiting:
+            waiting.remove(entry)
+            if not priority and not waiting:
+                del self._by_user[user]
+
+    def _next_waiter(self):
+        """следующий ожидающий (future, weight, пользователь), без извлечения из очереди; отменённые отбрасываются"""
+        while True:
+            if self._priority:
+                waiting = self._priority
+            elif self._by_user:
+                waiting = next(iter(self._by_user.values()))
+            else:
+                return None
+            # отменённый запрос сам уберёт себя из счётчика, пропускаем его
+            if not waiting[0][0].cancelled():
+                return waiting[0]
+            self._pop_waiter()
+
+    def _pop_waiter(self):
+        if self._priority:
+            return self._priority.popleft()
+        user, waiting = next(iter(self._by_user.items()))
+        entry = waiting.popleft()
+        # пользователь уходит в конец круга (или из очереди, если больше ничего не ждёт)
+        del self._by_user[user]
+        if waiting:
+            self._by_user[user] = waiting
+        return entry
+
+    def _release(self, weight: int = 1):
+        self.running -= weight
+        # места переходят к ожидающим по порядку очереди; тяжёлый запрос в голове ждёт,
+        # пока освободится нужное ему число мест, - его не обгоняют, иначе он мог бы ждать вечно
+        while True:
+            entry = self._next_waiter()
+            if entry is None or self.running + entry[1] > self.max_concurrency:
+                return
+            self._pop_waiter()
+            self._depth -= 1
+            self.running += entry[1]
+            entry[0].set_result(None)
+
+    def snapshot(self) -> dict:
+        return {
+            "queue_depth": self._depth,
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "estimated_wait_seconds": round(self.estimated_wait(), 1),
+            **self.stats,
+        }
@@ -0,0 +1,67 @@
+"""
+Схема ответа модели: презентация из слайдов четырёх типов или отказ с причиной.
+Повторяет JSON-схему в triton/Mixtral-8x7B-Instruct-v0.1-GGUF/1/slide_schema.py,
+по которой модель декодирует ответ под грамматикой, - при изменении править оба файла.
+"""
+from typing import Annotated, List, Literal, Union
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+
+
+class SchemaModel(BaseModel):
+    # лишние поля - ошибка: проверенный текст модели отдаётся клиенту как есть, без пересборки
+    model_config = ConfigDict(extra="forbid")
+
+
+class TitleSlide(SchemaModel):
+    type: Literal["title_slide"]
+    title: str
+    subtitle: str
+
+
+class ContentSlide(SchemaModel):
+    type: Literal["content_slide"]
+    title: str
+    content: List[str] = Field(min_length=1)
+    image_description: str
+
+
+class ImageSlide(SchemaModel):
+    type: Literal["image_slide"]
+    title: str
+    image_description: str
+
+
+class FinalSlide(SchemaModel):
+    type: Literal["final_slide"]
+    title: str
+    subtitle: str
+
+
+# тип слайда определяется полем "type" - pydantic сразу выбирает нужную модель
+Slide = Annotated[Union[TitleSlide, ContentSlide, ImageSlide, FinalSlide], Field(discriminator="type")]
+
+
+class Presentation(SchemaModel):
+    title: str
+    slides: List[Slide] = Field(min_length=1)
+
+
+class GenerationError(SchemaModel):
+    """отказ модели: неподходящий или слишком размытый запрос"""
+    error: Literal[True]
+    reason: Literal["inappropriate_request", "ambiguous_request"]
+    message: str
+
+
+GenerationResult = Union[Presentation, GenerationError]
+
+
+class SlidesPatch(SchemaModel):
+    """ответ модели в режиме правки: только новые слайды на замену выбранным"""
+    slides: List[Slide] = Field(min_length=1)
+
+
+# разбор и проверка за один проход: validate_json читает строку модели сразу в модели pydantic
+GENERATION_RESULT = TypeAdapter(GenerationResult)
+SLIDES_PATCH = TypeAdapter(SlidesPatch)
@@ -0,0 +1,51 @@
+import secrets
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    """
+    Сессии в памяти процесса: токен из /api/auth/login -> пользователь.
+    Токен живёт ttl секунд с последнего использования; сессий не больше max_sessions -
+    при переполнении вытесняются давно не использованные.
+    """
+    def __init__(self, ttl: float = 43200.0, max_sessions: int = 10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()    # токен -> (expires_at, пользователь), порядок = давность использования
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self, user: dict) -> str:
+        token = secrets.token_urlsafe(32)
+        self._sessions[token] = (time.monotonic() + self.ttl, user)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return token
+
+    def get(self, token: str):
+        """пользователь по токену, если сессия есть и не истекла (и продлевает её), иначе None"""
+        entry = self._sessions.get(token)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        expires_at, user = entry
+        if expires_at <= now:
+            del self._sessions[token]
+            return None
+        self._sessions[token] = (now + self.ttl, user)
+        self._sessions.move_to_end(token)
+        self._expire(now)
+        return user
+
+    def revoke(self, token: str) -> bool:
+        return self._sessions.pop(token, None) is not None
+
+    def _expire(self, now: float):
+        # самые давно использованные - в начале; снимаем истёкшие, пока не встретим живую
+        while self._sessions:
+            token, (expires_at, _) = next(iter(self._sessions.items()))
+            if expires_at > now:
+                return
+            del self._sessions[token]
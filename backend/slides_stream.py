@@ -0,0 +1,61 @@
+import json
+
+
+class SlidesStreamParser:
+    """
+    Инкрементальный разбор JSON-ответа модели.
+    feed() принимает очередной кусок сгенерированного текста и возвращает слайды
+    (элементы верхнеуровневого массива "slides"), которые уже пришли целиком.
+    Сам текст не перепарсивается: каждый символ просматривается ровно один раз.
+    """
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None         # последняя строка на верхнем уровне объекта
+        self._slides_depth = None     # глубина внутри массива "slides", если он открыт
+        self._slide_start = None      # начало текущего слайда в self.text
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        text = self.text
+        completed = []
+
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in '{[':
+                if ch == '[' and self._depth == 1 and self._last_key == "slides":
+                    self._slides_depth = 2
+                elif ch == '{' and self._depth == self._slides_depth:
+                    self._slide_start = i
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if ch == '}' and self._slide_start is not None and self._depth == self._slides_depth:
+                    completed.append(json.loads(text[self._slide_start:i + 1]))
+                    self._slide_start = None
+                elif ch == ']' and self._depth == 1 and self._slides_depth is not None:
+                    self._slides_depth = None
+            elif ch == ',' and self._depth == 1:
+                self._last_key = None
+
+        self._pos = len(text)
+        return completed
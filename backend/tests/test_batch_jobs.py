@@ -0,0 +1,84 @@
+"""
+Тесты пакетных заданий: поток NDJSON и дочитывание с места обрыва:
+    cd backend && python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+import orjson
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from batch_jobs import BatchJob, BatchJobStore, TooManyJobsError  # noqa: E402
+
+
+async def read_all(job, offset=0):
+    return [orjson.loads(line) async for line in job.stream(offset)]
+
+
+class BatchJobTest(unittest.IsolatedAsyncioTestCase):
+    async def test_reader_gets_lines_as_they_are_added(self):
+        job = BatchJob("teacher", total=2)
+        job.add({"job_id": job.id, "total": 2})
+        reader = asyncio.create_task(read_all(job))
+        await asyncio.sleep(0)
+        job.add_line(b'{"index":1,"status":"ok"}\n')
+        await asyncio.sleep(0)
+        job.add({"index": 0, "status": "error"})
+        self.assertFalse(reader.done())
+        job.finish({"done": True, "succeeded": 1, "failed": 1})
+
+        records = await asyncio.wait_for(reader, 1)
+        self.assertEqual([r.get("index") for r in records], [None, 1, 0, None])
+        self.assertTrue(records[-1]["done"])
+        # каждая запись - одна строка NDJSON
+        self.assertTrue(all(line.endswith(b"\n") and line.count(b"\n") == 1 for line in job.lines))
+
+    async def test_resume_from_offset(self):
+        job = BatchJob("teacher", total=3)
+        job.add({"job_id": job.id, "total": 3})
+        for index in range(3):
+            job.add({"index": index})
+        first = []
+        async for line in job.stream():
+            first.append(line)
+            if len(first) == 2:
+                break    # связь оборвалась после двух строк
+
+        resumed = asyncio.create_task(read_all(job, offset=len(first)))
+        await asyncio.sleep(0)
+        job.finish({"done": True})
+        records = await asyncio.wait_for(resumed, 1)
+        self.assertEqual(records, [{"index": 1}, {"index": 2}, {"done": True}])
+
+    async def test_finish_is_final(self):
+        job = BatchJob("teacher", total=1)
+        job.finish({"done": True, "cancelled": True})
+        job.finish({"done": True, "cancelled": False})
+        self.assertEqual(await read_all(job), [{"done": True, "cancelled": True}])
+        self.assertEqual(await read_all(job, offset=5), [])
+
+
+class BatchJobStoreTest(unittest.IsolatedAsyncioTestCase):
+    async def test_owner_and_limit(self):
+        store = BatchJobStore(max_active=1, ttl=60.0)
+        job = store.create("teacher", total=1)
+        self.assertIs(store.get(job.id, "teacher"), job)
+        self.assertIsNone(store.get(job.id, "someone_else"))
+        with self.assertRaises(TooManyJobsError):
+            store.create("teacher", total=1)
+        job.finish({"done": True})
+        store.create("teacher", total=1)
+
+    async def test_finished_job_expires(self):
+        store = BatchJobStore(ttl=60.0)
+        job = store.create("teacher", total=1)
+        job.finish({"done": True})
+        job.finished_at -= 61
+        self.assertIsNone(store.get(job.id, "teacher"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Тесты кодирования запроса /infer и разбора ответа в бинарном расширении тензоров:
+    cd backend && python -m unittest discover tests
+"""
+import json
+import os
+import struct
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from triton_client import decode_binary_infer_response, encode_binary_infer_request  # noqa: E402
+
+
+def bytes_tensor(values):
+    return b"".join(struct.pack("<I", len(v)) + v for v in values)
+
+
+def binary_response(outputs):
+    """тело ответа Triton: JSON-заголовок и сырые данные выходов в том же порядке"""
+    header = json.dumps({"outputs": [
+        {"name": name, "datatype": "BYTES", "shape": [1], "parameters": {"binary_data_size": len(raw)}}
+        for name, raw in outputs
+    ]}).encode("utf-8")
+    return header + b"".join(raw for _, raw in outputs), len(header)
+
+
+class EncodeRequestTest(unittest.TestCase):
+    def test_strings_and_ints(self):
+        body, header_length = encode_binary_infer_request({"prompt": ["Атом", "Клетка"], "slide_index": 2})
+        header = json.loads(body[:header_length])
+        prompt, index = header["inputs"]
+        self.assertEqual((prompt["name"], prompt["datatype"], prompt["shape"]), ("prompt", "BYTES", [2, 1]))
+        self.assertEqual((index["name"], index["datatype"], index["shape"]), ("slide_index", "INT32", [1, 1]))
+        self.assertEqual(header["outputs"], [{"name": "generated_text", "parameters": {"binary_data": True}}])
+
+        raw = body[header_length:]
+        prompt_size = prompt["parameters"]["binary_data_size"]
+        self.assertEqual(raw[:prompt_size], bytes_tensor(["Атом".encode(), "Клетка".encode()]))
+        self.assertEqual(raw[prompt_size:], struct.pack("<i", 2))
+        self.assertEqual(len(raw), prompt_size + index["parameters"]["binary_data_size"])
+
+
+class DecodeResponseTest(unittest.TestCase):
+    def test_binary_batch_after_other_output(self):
+        texts = ['{"title": "Атом"}'.encode(), b"", b'{"title": "\\n"}']
+        content, header_length = binary_response([
+            ("tokens", b"\x01\x02\x03"),
+            ("generated_text", bytes_tensor(texts)),
+        ])
+        self.assertEqual(decode_binary_infer_response(content, str(header_length)), texts)
+
+    def test_json_response_without_binary_header(self):
+        content = json.dumps({"outputs": [{"name": "generated_text", "data": ["{}"]}]}).encode()
+        self.assertEqual(decode_binary_infer_response(content, None), ["{}"])
+
+    def test_json_output_inside_binary_response(self):
+        header = json.dumps({"outputs": [{"name": "generated_text", "data": ["{}"]}]}).encode()
+        self.assertEqual(decode_binary_infer_response(header, len(header)), ["{}"])
+
+    def test_missing_output(self):
+        content, header_length = binary_response([("tokens", b"\x01")])
+        self.assertIsNone(decode_binary_infer_response(content, header_length))
+
+
+if __name__ == "__main__":
+    unittest.main()
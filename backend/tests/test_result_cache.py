@@ -0,0 +1,88 @@
+"""
+Тесты кэша результатов (в памяти, без sqlite):
+    cd backend && python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from result_cache import ResultCache  # noqa: E402
+
+
+class SlowCompute:
+    """вызов модели, который при отмене ещё какое-то время сворачивается (как закрытие соединения httpx)"""
+    def __init__(self, value=b"deck", unwind=0.05):
+        self.value = value
+        self.unwind = unwind
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            await asyncio.shield(asyncio.sleep(self.unwind))
+            raise
+        return self.value
+
+
+class ResultCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_hit_after_miss(self):
+        cache = ResultCache()
+        key = cache.make_key("Слайды про атом", "mixtral")
+        compute = SlowCompute()
+        compute.release.set()
+        self.assertEqual(await cache.get_or_compute(key, compute), (b"deck", "MISS"))
+        self.assertEqual(await cache.get_or_compute(key, compute), (b"deck", "HIT"))
+        self.assertEqual(compute.calls, 1)
+
+    async def test_key_depends_on_version(self):
+        old, new = ResultCache(version="1"), ResultCache(version="2")
+        self.assertEqual(old.make_key("Слайды про атом.", "mixtral"), old.make_key("слайды  про атом", "mixtral"))
+        self.assertNotEqual(old.make_key("Слайды про атом", "mixtral"), new.make_key("Слайды про атом", "mixtral"))
+
+    async def test_concurrent_requests_share_one_call(self):
+        cache = ResultCache()
+        compute = SlowCompute()
+        first = asyncio.create_task(cache.get_or_compute("k", compute))
+        second = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        compute.release.set()
+        self.assertEqual(await first, (b"deck", "MISS"))
+        self.assertEqual(await second, (b"deck", "COALESCED"))
+        self.assertEqual(compute.calls, 1)
+
+    async def test_rejoin_after_last_waiter_cancelled(self):
+        cache = ResultCache()
+        compute = SlowCompute()
+        abandoned = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        abandoned.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await abandoned
+
+        # прежний вызов ещё сворачивается, а такой же запрос уже пришёл
+        retry = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        compute.release.set()
+        self.assertEqual(await retry, (b"deck", "MISS"))
+        self.assertEqual(compute.calls, 2)
+
+        # свёрнутый вызов не удаляет из _in_flight новый
+        await asyncio.sleep(compute.unwind * 2)
+        self.assertEqual(await cache.get_or_compute("k", compute), (b"deck", "HIT"))
+
+    async def test_value_with_zero_ttl_is_not_cached(self):
+        cache = ResultCache(ttl_of=lambda value: 0.0 if value == b"refusal" else 60.0)
+        cache.set("refusal", b"refusal")
+        cache.set("deck", b"deck")
+        self.assertIsNone(await cache.get("refusal"))
+        self.assertEqual(await cache.get("deck"), b"deck")
+
+
+if __name__ == "__main__":
+    unittest.main()
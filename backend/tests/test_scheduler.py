@@ -0,0 +1,132 @@
+"""
+Тесты очереди генераций:
+    cd backend && python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from scheduler import FairScheduler, QueueFullError  # noqa: E402
+
+
+class FairSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.order = []
+        self.running = {}    # метка -> событие, по которому запрос освобождает место
+
+    def start(self, scheduler, user, label, priority=False, weight=1):
+        """запрос пользователя: занимает место, записывает метку и держит место до release(label)"""
+        done = asyncio.Event()
+        self.running[label] = done
+
+        async def request():
+            async with scheduler.slot(user, priority=priority, weight=weight):
+                self.order.append(label)
+                await done.wait()
+        return asyncio.create_task(request())
+
+    async def release(self, label):
+        self.running[label].set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    async def test_round_robin_between_users(self):
+        scheduler = FairScheduler(max_concurrency=1, max_queue=10)
+        tasks = [self.start(scheduler, "busy", "busy-0")]
+        await asyncio.sleep(0)
+        tasks += [self.start(scheduler, "busy", f"busy-{i}") for i in range(1, 4)]
+        tasks.append(self.start(scheduler, "other", "other-0"))
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.depth, 4)
+
+        for label in ["busy-0", "busy-1", "other-0", "busy-2"]:
+            await self.release(label)
+        await self.release("busy-3")
+        await asyncio.gather(*tasks)
+        # второй пользователь не ждёт, пока пройдут все запросы первого
+        self.assertEqual(self.order, ["busy-0", "busy-1", "other-0", "busy-2", "busy-3"])
+
+    async def test_priority_lane_goes_first(self):
+        scheduler = FairScheduler(max_concurrency=1, max_queue=10)
+        tasks = [self.start(scheduler, "u1", "u1-0")]
+        await asyncio.sleep(0)
+        tasks.append(self.start(scheduler, "u2", "u2-0"))
+        tasks.append(self.start(scheduler, "admin", "admin-0", priority=True))
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.position_of("admin"), 0)
+        self.assertEqual(scheduler.position_of("u2"), 1)
+        self.assertTrue(scheduler.is_waiting("admin"))
+        self.assertFalse(scheduler.is_waiting("u1"))    # его запрос уже выполняется
+
+        for label in ["u1-0", "admin-0", "u2-0"]:
+            await self.release(label)
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.order, ["u1-0", "admin-0", "u2-0"])
+
+    async def test_weighted_request_waits_for_enough_slots(self):
+        scheduler = FairScheduler(max_concurrency=3, max_queue=10)
+        tasks = [self.start(scheduler, "u1", "a"), self.start(scheduler, "u1", "b")]
+        await asyncio.sleep(0)
+        tasks.append(self.start(scheduler, "batch", "batch", weight=3))
+        tasks.append(self.start(scheduler, "u2", "c"))
+        await asyncio.sleep(0)
+        # третье место свободно, но пачка в голове очереди ждёт трёх, и c её не обгоняет
+        self.assertEqual(scheduler.running, 2)
+        self.assertEqual(self.order, ["a", "b"])
+
+        await self.release("a")
+        self.assertEqual(self.order, ["a", "b"])
+        await self.release("b")
+        self.assertEqual(self.order, ["a", "b", "batch"])
+        self.assertEqual(scheduler.running, 3)
+        await self.release("batch")
+        await self.release("c")
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.order, ["a", "b", "batch", "c"])
+        self.assertEqual(scheduler.running, 0)
+
+    async def test_queue_full(self):
+        scheduler = FairScheduler(max_concurrency=1, max_queue=1)
+        tasks = [self.start(scheduler, "u1", "a")]
+        await asyncio.sleep(0)
+        tasks.append(self.start(scheduler, "u2", "b"))
+        await asyncio.sleep(0)
+        self.assertTrue(scheduler.is_full())
+        with self.assertRaises(QueueFullError) as raised:
+            async with scheduler.slot("u3"):
+                pass
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(scheduler.stats["rejected"], 1)
+
+        await self.release("a")
+        await self.release("b")
+        await asyncio.gather(*tasks)
+
+    async def test_cancelled_waiter_leaves_queue(self):
+        scheduler = FairScheduler(max_concurrency=1, max_queue=10)
+        tasks = [self.start(scheduler, "u1", "a")]
+        await asyncio.sleep(0)
+        abandoned = self.start(scheduler, "u2", "abandoned")
+        tasks.append(self.start(scheduler, "u3", "c"))
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.depth, 2)
+
+        abandoned.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await abandoned
+        self.assertEqual(scheduler.depth, 1)
+        self.assertEqual(scheduler.position_of("u3"), 0)
+
+        await self.release("a")
+        await self.release("c")
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.order, ["a", "c"])
+        self.assertEqual((scheduler.running, scheduler.depth), (0, 0))
+        self.assertEqual(scheduler.stats["cancelled"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
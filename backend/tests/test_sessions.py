@@ -0,0 +1,47 @@
+"""
+Тесты хранилища сессий:
+    cd backend && python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sessions import SessionStore  # noqa: E402
+
+
+class SessionStoreTest(unittest.TestCase):
+    def test_expires_after_ttl_and_slides_on_use(self):
+        store = SessionStore(ttl=10.0)
+        with mock.patch("sessions.time.monotonic", return_value=100.0):
+            token = store.create({"username": "u"})
+        with mock.patch("sessions.time.monotonic", return_value=108.0):
+            self.assertEqual(store.get(token), {"username": "u"})
+        with mock.patch("sessions.time.monotonic", return_value=116.0):
+            self.assertEqual(store.get(token), {"username": "u"})
+        with mock.patch("sessions.time.monotonic", return_value=127.0):
+            self.assertIsNone(store.get(token))
+        self.assertEqual(len(store), 0)
+
+    def test_evicts_least_recently_used(self):
+        store = SessionStore(ttl=60.0, max_sessions=2)
+        first = store.create({"username": "a"})
+        second = store.create({"username": "b"})
+        store.get(first)
+        store.create({"username": "c"})
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get(second))
+        self.assertIsNotNone(store.get(first))
+
+    def test_revoke(self):
+        store = SessionStore()
+        token = store.create({"username": "u"})
+        self.assertTrue(store.revoke(token))
+        self.assertIsNone(store.get(token))
+        self.assertFalse(store.revoke(token))
+
+
+if __name__ == "__main__":
+    unittest.main()
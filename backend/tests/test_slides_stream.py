@@ -0,0 +1,62 @@
+"""
+Тесты инкрементального разбора слайдов из потока модели:
+    cd backend && python -m unittest discover tests
+"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from slides_stream import SlidesStreamParser  # noqa: E402
+
+
+DECK = {
+    "title": "Фигурные {скобки} и \"кавычки\" в slides",
+    "slides": [
+        {"type": "title_slide", "title": "Множества {1, 2, 3}", "subtitle": "путь C:\\temp\\"},
+        {"type": "content_slide", "title": "Массивы [0]", "content": ["a}b", "c]d", "\"{\""],
+         "image_description": "доска"},
+        {"type": "final_slide", "title": "Конец", "subtitle": "\\\"}"},
+    ],
+}
+
+
+def feed_in_chunks(text, size):
+    parser = SlidesStreamParser()
+    slides = []
+    for start in range(0, len(text), size):
+        slides.extend(parser.feed(text[start:start + size]))
+    return parser, slides
+
+
+class SlidesStreamParserTest(unittest.TestCase):
+    def test_any_chunk_boundary(self):
+        text = json.dumps(DECK, ensure_ascii=False)
+        # размер 1 режет и экранирование (\ и " в разных кусках), и каждую скобку
+        for size in (1, 2, 3, 7, len(text)):
+            with self.subTest(size=size):
+                parser, slides = feed_in_chunks(text, size)
+                self.assertEqual(slides, DECK["slides"])
+                self.assertEqual(parser.text, text)
+
+    def test_slide_is_returned_as_soon_as_it_closes(self):
+        parser = SlidesStreamParser()
+        self.assertEqual(parser.feed('{"title": "t", "slides": [{"type": "title_slide", "title": "a"'), [])
+        self.assertEqual(parser.feed(', "subtitle": "b"}'), [{"type": "title_slide", "title": "a", "subtitle": "b"}])
+        self.assertEqual(parser.feed(', {"type": "final_slide"'), [])
+
+    def test_nested_slides_key_is_ignored(self):
+        text = '{"meta": {"slides": [{"a": 1}]}, "title": "slides", "slides": [{"b": 2}]}'
+        _, slides = feed_in_chunks(text, 1)
+        self.assertEqual(slides, [{"b": 2}])
+
+    def test_refusal_has_no_slides(self):
+        text = '{"error": true, "reason": "ambiguous_request", "message": "Уточните {тему}"}'
+        _, slides = feed_in_chunks(text, 5)
+        self.assertEqual(slides, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+"""
+Тесты предохранителя и маршрутизатора реплик Triton на клиентах-заглушках, без сети:
+    cd backend && python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from triton_client import ModelOutputError, TritonUnavailableError  # noqa: E402
+from triton_router import CircuitBreaker, TritonRouter  # noqa: E402
+
+
+class StubClient:
+    """заглушка TritonClient: infer отдаёт или бросает очередной элемент results"""
+    protocol = "generate"
+    in_flight = 0
+
+    def __init__(self, url, results=None):
+        self.url = url
+        self.results = list(results or [])
+        self.calls = 0
+
+    async def infer(self, prompt_text):
+        self.calls += 1
+        result = self.results.pop(0) if self.results else b"{}"
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    async def infer_stream(self, prompt_text):
+        self.calls += 1
+        result = self.results.pop(0) if self.results else ["{", "}"]
+        if isinstance(result, BaseException):
+            raise result
+        for delta in result:
+            yield delta
+
+    async def close(self):
+        pass
+
+
+def make_router(*clients, failure_threshold=1, reset_timeout=30.0, max_attempts=2):
+    router = TritonRouter(
+        [client.url for client in clients], "mixtral",
+        max_attempts=max_attempts, failure_threshold=failure_threshold, reset_timeout=reset_timeout,
+    )
+    for replica, client in zip(router.replicas, clients):
+        replica.client = client
+        replica.last_probe_at = 0.0
+    return router
+
+
+def open_and_expire(breaker: CircuitBreaker):
+    """размыкает предохранитель и делает вид, что reset_timeout уже прошёл"""
+    breaker.on_dispatch()
+    breaker.on_failure()
+    breaker.opened_at -= breaker.reset_timeout
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+        breaker.on_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.on_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.can_pass())
+
+    def test_half_open_allows_single_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+        open_and_expire(breaker)
+        self.assertTrue(breaker.can_pass())
+        breaker.on_dispatch()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.can_pass())
+        breaker.on_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.can_pass())
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+        open_and_expire(breaker)
+        breaker.on_dispatch()
+        breaker.on_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.can_pass())
+
+    def test_cancelled_trial_frees_slot(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+        open_and_expire(breaker)
+        breaker.on_dispatch()
+        breaker.on_cancel()
+        self.assertTrue(breaker.can_pass())
+
+
+class TritonRouterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_unavailable_on_other_replica(self):
+        down = StubClient("a", [TritonUnavailableError("503")])
+        up = StubClient("b", [b"ok"])
+        router = make_router(down, up)
+        router.replicas[1].outstanding = 1   # чтобы первой выбиралась реплика a
+        self.assertEqual(await router.infer("prompt"), b"ok")
+        self.assertEqual((down.calls, up.calls), (1, 1))
+
+    async def test_single_replica_keeps_original_error(self):
+        client = StubClient("a", [TritonUnavailableError("connection refused")])
+        router = make_router(client, failure_threshold=5)
+        with self.assertRaisesRegex(TritonUnavailableError, "connection refused"):
+            await router.infer("prompt")
+        self.assertEqual(client.calls, 1)
+        self.assertEqual([d["outcome"] for d in router.decisions], ["unavailable"])
+
+    async def test_stream_keeps_original_error_without_other_replicas(self):
+        client = StubClient("a", [TritonUnavailableError("connection refused")])
+        router = make_router(client, failure_threshold=5)
+        with self.assertRaisesRegex(TritonUnavailableError, "connection refused"):
+            async for _ in router.infer_stream("prompt"):
+                pass
+        self.assertEqual([d["outcome"] for d in router.decisions], ["unavailable"])
+
+    async def test_model_output_error_is_not_replica_failure(self):
+        client = StubClient("a", [ModelOutputError("bad json")])
+        router = make_router(client)
+        with self.assertRaises(ModelOutputError):
+            await router.infer("prompt")
+        self.assertEqual(router.replicas[0].breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_unexpected_error_on_trial_does_not_wedge_breaker(self):
+        client = StubClient("a", [ValueError("not json"), b"ok"])
+        router = make_router(client)
+        breaker = router.replicas[0].breaker
+        open_and_expire(breaker)
+
+        with self.assertRaises(ValueError):
+            await router.infer("prompt")
+        # пробный запрос упал - предохранитель снова open, но не заблокирован навсегда
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(router.replicas[0].outstanding, 0)
+
+        breaker.opened_at -= breaker.reset_timeout
+        self.assertEqual(router.healthy_count, 1)
+        self.assertEqual(await router.infer("prompt"), b"ok")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_unexpected_error_in_stream_is_recorded(self):
+        client = StubClient("a", [KeyError("outputs"), ["{", "}"]])
+        router = make_router(client)
+        breaker = router.replicas[0].breaker
+        open_and_expire(breaker)
+
+        with self.assertRaises(KeyError):
+            async for _ in router.infer_stream("prompt"):
+                pass
+        breaker.opened_at -= breaker.reset_timeout
+        chunks = [delta async for delta in router.infer_stream("prompt")]
+        self.assertEqual(chunks, ["{", "}"])
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_readiness_ignores_running_trial(self):
+        router = make_router(StubClient("a"))
+        breaker = router.replicas[0].breaker
+        open_and_expire(breaker)
+        breaker.on_dispatch()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(router.healthy_count, 1)
+
+    async def test_no_replica_available(self):
+        router = make_router(StubClient("a"))
+        with mock.patch.object(router.replicas[0].breaker, "can_pass", return_value=False):
+            with self.assertRaises(TritonUnavailableError):
+                await router.infer("prompt")
+
+
+if __name__ == "__main__":
+    unittest.main()
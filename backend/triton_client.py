@@ -0,0 +1,371 @@
+import asyncio
+import logging
+import struct
+import time
+
+import httpx
+import orjson
+from pydantic import ValidationError
+
+from metrics import (
+    TRITON_ROUNDTRIP,
+    MODEL_JSON_DECODE,
+    MODEL_OUTPUT_VALID,
+    MODEL_OUTPUT_INVALID_JSON,
+    MODEL_OUTPUT_INVALID_SCHEMA,
+)
+from schemas import GENERATION_RESULT, SLIDES_PATCH
+
+
+logger = logging.getLogger(__name__)
+
+# заголовок бинарного расширения KServe v2: длина JSON-части тела, дальше идут сырые тензоры
+INFERENCE_HEADER = "Inference-Header-Content-Length"
+# элемент BYTES-тензора в бинарном виде: 4 байта длины (little-endian) и сами байты
+BYTES_LENGTH = struct.Struct("<I")
+INT32 = struct.Struct("<i")
+
+
+class ModelOutputError(ValueError):
+    """модель ответила, но её вывод - не JSON или не соответствует схеме презентации"""
+
+
+class TritonUnavailableError(ConnectionError):
+    """запрос не дошёл до модели (нет соединения, Triton отказал сразу) - его безопасно повторить на другой реплике"""
+
+
+# ответы Triton, после которых генерация точно не запускалась
+REJECTED_STATUS_CODES = (429, 502, 503)
+
+
+def network_error(e: httpx.HTTPError) -> ConnectionError:
+    """
+    ошибка httpx -> ConnectionError. Если запрос заведомо не начал выполняться
+    (не удалось соединиться, не дождались соединения из пула, Triton отказал),
+    это TritonUnavailableError; обрыв или таймаут чтения - нет: генерация могла уже идти
+    """
+    message = f"Ошибка сети при обращении к Triton: {e!r}"
+    if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return TritonUnavailableError(message)
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in REJECTED_STATUS_CODES:
+        return TritonUnavailableError(message)
+    return ConnectionError(message)
+
+
+def is_json_error(e: ValidationError) -> bool:
+    """ошибка в самом синтаксисе JSON, а не в его структуре"""
+    return any(error["type"] == "json_invalid" for error in e.errors())
+
+
+def validate_model_output(text) -> bytes:
+    """
+    Разбирает и проверяет текст модели по схеме из schemas.py за один проход
+    и возвращает его же в виде байтов JSON - без повторной сериализации.
+    Некорректный JSON или несоответствие схеме - ModelOutputError.
+    """
+    parse_model_output(text, GENERATION_RESULT)
+    return text.encode("utf-8") if isinstance(text, str) else text
+
+
+def is_generation_error(data: bytes) -> bool:
+    """проверенный ответ модели - отказ (GenerationError), а не презентация"""
+    result = orjson.loads(data)
+    return isinstance(result, dict) and result.get("error") is True
+
+
+def parse_model_output(text, adapter):
+    """разбор и проверка текста модели по схеме adapter; возвращает объект pydantic"""
+    try:
+        started = time.perf_counter()
+        result = adapter.validate_json(text)
+        MODEL_JSON_DECODE.observe(time.perf_counter() - started)
+    except ValidationError as e:
+        if is_json_error(e):
+            MODEL_OUTPUT_INVALID_JSON.inc()
+            logger.error(f"Ошибка декодирования JSON от Triton. Ответ модели: '{text[:500]!r}'")
+            logger.error(f"Детали ошибки: {e}")
+            raise ModelOutputError("Модель вернула некорректный JSON.") from e
+        MODEL_OUTPUT_INVALID_SCHEMA.inc()
+        logger.error(f"Ответ модели не соответствует схеме: {e}. Ответ модели: '{text[:500]!r}'")
+        raise ModelOutputError("Модель вернула JSON неверной структуры.") from e
+    MODEL_OUTPUT_VALID.inc()
+    return result
+
+
+def encode_binary_infer_request(inputs: dict):
+    """
+    Тело запроса /infer с бинарным расширением: короткий JSON-заголовок
+    и входы сырыми байтами (строки - BYTES, целые - INT32); ответ generated_text
+    тоже просим в бинарном виде. Список значений - несколько строк батч-измерения (форма [N, 1]).
+    Возвращает (тело, длина JSON-заголовка).
+    """
+    tensors, chunks = [], []
+    for name, value in inputs.items():
+        values = value if isinstance(value, list) else [value]
+        if isinstance(values[0], int):
+            datatype, raw = "INT32", b"".join(INT32.pack(v) for v in values)
+        else:
+            values = [v.encode("utf-8") if isinstance(v, str) else v for v in values]
+            datatype, raw = "BYTES", b"".join(BYTES_LENGTH.pack(len(v)) + v for v in values)
+        tensors.append({
+            "name": name,
+            "shape": [len(values), 1],
+            "datatype": datatype,
+            "parameters": {"binary_data_size": len(raw)},
+        })
+        chunks.append(raw)
+    header = orjson.dumps({
+        "inputs": tensors,
+        "outputs": [{"name": "generated_text", "parameters": {"binary_data": True}}],
+    })
+    return header + b"".join(chunks), len(header)
+
+
+def decode_binary_infer_response(content: bytes, header_length):
+    """
+    Достаёт тексты generated_text (по одному на строку батч-измерения) из ответа /infer.
+    В бинарном ответе разбирается только JSON-заголовок, а тексты модели - срезы тела
+    без экранирования. None - если такого выхода в ответе нет.
+    """
+    if header_length is None:
+        # Triton ответил обычным JSON (например, выход не был запрошен бинарным)
+        for output in orjson.loads(content).get("outputs", []):
+            if output["name"] == "generated_text":
+                return output["data"]
+        return None
+
+    header_length = int(header_length)
+    offset = header_length
+    for output in orjson.loads(content[:header_length]).get("outputs", []):
+        size = output.get("parameters", {}).get("binary_data_size")
+        if size is None:
+            if output["name"] == "generated_text":
+                return output["data"]
+            continue
+        if output["name"] == "generated_text":
+            texts, end = [], offset + size
+            while offset < end:
+                (length,) = BYTES_LENGTH.unpack_from(content, offset)
+                offset += BYTES_LENGTH.size
+                texts.append(content[offset:offset + length])
+                offset += length
+            return texts
+        offset += size
+    return None
+
+
+class TritonClient:
+    """
+    Асинхронный клиент для Triton Inference Server (HTTP/REST, KServe v2).
+    Держит общий пул keep-alive соединений и ограничивает число одновременных
+    запросов к модели, чтобы долгая генерация не блокировала event loop uvicorn.
+
+    protocol: "generate" - generate-расширение (работает и с decoupled-моделью),
+    "binary" - /infer с бинарным расширением тензоров: текст модели приходит сырыми байтами
+    и без перекодирования уходит клиенту. /infer требует модель с decoupled: false.
+    """
+    PROTOCOLS = ("generate", "binary")
+
+    def __init__(
+        self,
+        url: str,
+        model_name: str,
+        request_timeout: float = 300.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 16,
+        max_in_flight: int = 4,
+        protocol: str = "generate",
+    ):
+        if protocol not in self.PROTOCOLS:
+            raise ValueError(f"Неизвестный протокол Triton: {protocol!r}, ожидается один из {self.PROTOCOLS}")
+        self.url = url
+        self.protocol = protocol
+        self.model_name = model_name
+        self.max_in_flight = max_in_flight
+        self._timeout = httpx.Timeout(request_timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._client = None
+
+    @property
+    def in_flight(self) -> int:
+        """сколько запросов инференса сейчас выполняется"""
+        return self._in_flight
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # пул создаётся при первом обращении, уже внутри работающего event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=f"http://{self.url}",
+                timeout=self._timeout,
+                limits=self._limits,
+            )
+        return self._client
+
+    async def close(self):
+        """закрывает пул соединений (вызывается при остановке приложения)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def is_model_ready(self, timeout: float) -> bool:
+        """готова ли модель принимать запросы (/v2/models/{name}/ready) - для фоновых проверок, не бросает исключений"""
+        try:
+            response = await self._get_client().get(f"/v2/models/{self.model_name}/ready", timeout=timeout)
+            return response.status_code == 200
+        except httpx.HTTPError as e:
+            logger.warning(f"Triton недоступен ({self.url}): {e!r}")
+            return False
+
+    async def infer(self, prompt_text: str) -> bytes:
+        """
+        Отправляет промпт в модель и возвращает сгенерированную презентацию - байты JSON,
+        проверенные по схеме из schemas.py и готовые к отправке клиенту как есть.
+        Сетевые ошибки превращаются в ConnectionError, некорректный вывод модели
+        (не JSON или не по схеме) - в ModelOutputError.
+        При отмене корутины (клиент отключился) HTTP-запрос к Triton обрывается,
+        а слот в семафоре освобождается.
+        """
+        logger.info(f"Отправка запроса в Triton ({self.url}) с промптом: '{prompt_text[:70]}...'")
+        (output_data,) = await self._request({"prompt": prompt_text})
+        result_data = validate_model_output(output_data)
+        logger.info("[SUCCESS] Получен и обработан ответ от Triton.")
+        return result_data
+
+    async def regenerate_slides(self, instruction: str, presentation: bytes, slide_index: int, slide_count: int) -> list:
+        """
+        Режим правки модели: перегенерирует slide_count слайдов презентации начиная с slide_index
+        по инструкции и возвращает только новые слайды (список словарей).
+        Модель видит презентацию как компактный план и пишет лишь заменяемые слайды.
+        """
+        logger.info(f"Правка слайдов {slide_index}..{slide_index + slide_count - 1} в Triton: '{instruction[:70]}...'")
+        (output_data,) = await self._request({
+            "prompt": instruction,
+            "presentation": presentation,
+            "slide_index": slide_index,
+            "slide_count": slide_count,
+        })
+        patch = parse_model_output(output_data, SLIDES_PATCH)
+        if len(patch.slides) != slide_count:
+            logger.error(f"Модель вернула {len(patch.slides)} слайдов вместо {slide_count}.")
+            raise ModelOutputError(f"Модель вернула {len(patch.slides)} слайдов вместо {slide_count}.")
+        return SLIDES_PATCH.dump_python(patch)["slides"]
+
+    async def infer_batch(self, prompts: list) -> list:
+        """
+        Несколько промптов одним запросом /infer (батч-измерение входа prompt, протокол "binary";
+        для "generate" - параллельные запросы). Ошибки вывода модели не роняют весь пакет:
+        элемент результата - байты JSON, как у infer(), или ModelOutputError.
+        Сетевая ошибка - ConnectionError на весь пакет.
+        """
+        if self.protocol != "binary":
+            return await asyncio.gather(*(self.infer(prompt) for prompt in prompts), return_exceptions=True)
+
+        logger.info(f"Отправка пакета из {len(prompts)} промптов в Triton ({self.url})")
+        outputs = await self._request({"prompt": prompts})
+        if len(outputs) != len(prompts):
+            raise ModelOutputError(f"Triton вернул {len(outputs)} ответов на {len(prompts)} промптов")
+        results = []
+        for output_data in outputs:
+            try:
+                results.append(validate_model_output(output_data))
+            except ModelOutputError as e:
+                results.append(e)
+        return results
+
+    async def _request(self, inputs: dict) -> list:
+        """
+        один нестриминговый запрос к модели выбранным протоколом;
+        возвращает тексты модели - по одному на строку батч-измерения
+        """
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                started = time.perf_counter()
+                if self.protocol == "binary":
+                    output_data = await self._infer_binary(inputs)
+                else:
+                    output_data = await self._generate(inputs)
+                    output_data = None if output_data is None else [output_data]
+                TRITON_ROUNDTRIP.observe(time.perf_counter() - started)
+            except httpx.HTTPError as e:
+                logger.error(f"Ошибка сети при обращении к Triton ({self.url}): {e!r}")
+                raise network_error(e) from e
+            finally:
+                self._in_flight -= 1
+
+        if not output_data:
+            raise ModelOutputError("Не найден ожидаемый output в ответе от Triton")
+        return output_data
+
+    async def _generate(self, inputs: dict):
+        """generate-расширение: текст модели - строка внутри JSON-ответа Triton"""
+        # generate-расширение Triton работает и с decoupled-моделью, если она отдаёт один ответ
+        payload = {name: value.decode("utf-8") if isinstance(value, bytes) else value for name, value in inputs.items()}
+        data_payload = orjson.dumps({**payload, "stream": False})
+        response = await self._get_client().post(
+            f"/v2/models/{self.model_name}/generate",
+            headers={'Content-Type': 'application/json'},
+            content=data_payload,
+        )
+        response.raise_for_status()
+        triton_response_data = orjson.loads(response.content)
+        output_data = triton_response_data.get('generated_text')
+        if output_data is None:
+            logger.error(f"В ответе от Triton не найден output с именем 'generated_text'. Ответ: {triton_response_data}")
+        return output_data
+
+    async def _infer_binary(self, inputs: dict):
+        """/infer с бинарным расширением: тексты модели - срезы тела ответа"""
+        data_payload, header_length = encode_binary_infer_request(inputs)
+        response = await self._get_client().post(
+            f"/v2/models/{self.model_name}/infer",
+            headers={'Content-Type': 'application/octet-stream', INFERENCE_HEADER: str(header_length)},
+            content=data_payload,
+        )
+        response.raise_for_status()
+        output_data = decode_binary_infer_response(response.content, response.headers.get(INFERENCE_HEADER))
+        if output_data is None:
+            logger.error("В ответе /infer от Triton не найден output с именем 'generated_text'.")
+        return output_data
+
+    async def infer_stream(self, prompt_text: str):
+        """
+        Потоковая генерация через /generate_stream (SSE от decoupled-модели).
+        Асинхронный генератор, отдающий фрагменты текста по мере их появления.
+        Закрытие генератора обрывает соединение с Triton.
+        """
+        data_payload = orjson.dumps({"prompt": prompt_text, "stream": True})
+
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                logger.info(f"Потоковый запрос в Triton ({self.url}) с промптом: '{prompt_text[:70]}...'")
+                started = time.perf_counter()
+                async with self._get_client().stream(
+                    "POST",
+                    f"/v2/models/{self.model_name}/generate_stream",
+                    headers={'Content-Type': 'application/json'},
+                    content=data_payload,
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        event = orjson.loads(line[len("data:"):])
+                        if "error" in event:
+                            logger.error(f"Triton вернул ошибку в потоке: {event['error']}")
+                            raise ModelOutputError(f"Ошибка генерации: {event['error']}")
+                        delta = event.get('generated_text')
+                        if delta:
+                            yield delta
+                TRITON_ROUNDTRIP.observe(time.perf_counter() - started)
+            except httpx.HTTPError as e:
+                logger.error(f"Ошибка сети при обращении к Triton ({self.url}): {e!r}")
+                raise network_error(e) from e
+            finally:
+                self._in_flight -= 1
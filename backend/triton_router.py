@@ -0,0 +1,342 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+from triton_client import TritonClient, TritonUnavailableError, ModelOutputError
+from metrics import TRITON_ROUTED, TRITON_REPLICA_HEALTHY, TRITON_REPLICA_BREAKER
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Предохранитель реплики: после failure_threshold ошибок подряд реплика выключается
+    на reset_timeout секунд (open), затем пропускает один пробный запрос (half_open):
+    успех - снова closed, ошибка - снова open.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        """разомкнут и таймаут ещё не прошёл: реплика сейчас точно не принимает запросы"""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def can_pass(self) -> bool:
+        """можно ли отправить запрос (не меняет состояние)"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return not self._trial_in_flight
+
+    def on_dispatch(self):
+        """запрос отправлен: после таймаута open превращается в half_open с одним пробным запросом"""
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            self._trial_in_flight = True
+
+    def on_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def on_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Предохранитель разомкнут после {self.failures} ошибок подряд")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def on_cancel(self):
+        """запрос отменён клиентом - это ни успех, ни ошибка реплики"""
+        self._trial_in_flight = False
+
+
+class Replica:
+    """реплика Triton: клиент, предохранитель, текущая нагрузка и здоровье"""
+    # вес реплики - скользящая доля успешных запросов, не ниже MIN_WEIGHT
+    SUCCESS_ALPHA = 0.2
+    MIN_WEIGHT = 0.1
+
+    def __init__(self, client: TritonClient, breaker: CircuitBreaker):
+        self.client = client
+        self.breaker = breaker
+        self.outstanding = 0
+        self.healthy = True          # до первой проверки считаем реплику здоровой
+        self.last_probe_at = None
+        self.success_rate = 1.0
+        self.stats = {"requests": 0, "failures": 0}
+
+    @property
+    def url(self) -> str:
+        return self.client.url
+
+    @property
+    def weight(self) -> float:
+        return max(self.MIN_WEIGHT, self.success_rate)
+
+    def score(self) -> float:
+        """меньше - лучше: запросы в работе (с учётом нового) на единицу веса"""
+        return (self.outstanding + 1) / self.weight
+
+    def record(self, success: bool):
+        self.stats["requests"] += 1
+        self.stats["failures"] += int(not success)
+        self.success_rate += self.SUCCESS_ALPHA * (float(success) - self.success_rate)
+        if success:
+            self.breaker.on_success()
+        else:
+            self.breaker.on_failure()
+        TRITON_REPLICA_BREAKER.labels(self.url).set(BREAKER_STATES.index(self.breaker.state))
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "outstanding": self.outstanding,
+            "weight": round(self.weight, 3),
+            "score": round(self.score(), 3),
+            "last_probe_seconds_ago": None if self.last_probe_at is None else round(time.time() - self.last_probe_at, 1),
+            **self.stats,
+        }
+
+
+BREAKER_STATES = (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN)
+
+
+class TritonRouter:
+    """
+    Несколько реплик Triton за одним интерфейсом TritonClient.
+    Запрос уходит на реплику с наименьшим числом запросов в работе на единицу веса
+    (вес - доля успешных ответов), минуя реплики, не прошедшие фоновую проверку
+    или с разомкнутым предохранителем. На другую реплику запрос повторяется, только если
+    он заведомо не начал выполняться (TritonUnavailableError) и поток ещё ничего не отдал.
+    """
+    STARTUP_PROBE_DELAY = 0.25
+
+    def __init__(
+        self,
+        urls: list,
+        model_name: str,
+        max_attempts: int = 2,
+        probe_interval: float = 5.0,
+        probe_timeout: float = 2.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        **client_options,
+    ):
+        self.model_name = model_name
+        self.max_attempts = max_attempts
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.replicas = [
+            Replica(TritonClient(url, model_name, **client_options), CircuitBreaker(failure_threshold, reset_timeout))
+            for url in urls
+        ]
+        self.protocol = self.replicas[0].client.protocol
+        self.decisions = deque(maxlen=100)   # последние решения маршрутизации, для отладки
+        self._probe_task = None
+
+    @property
+    def in_flight(self) -> int:
+        return sum(replica.client.in_flight for replica in self.replicas)
+
+    @property
+    def healthy_count(self) -> int:
+        """
+        реплики, которые проверка уже видела готовыми и чей предохранитель не разомкнут;
+        идущий пробный запрос half_open (целая генерация) не делает реплику неготовой,
+        а после reset_timeout реплика снова готова - иначе без трафика она не получила бы пробный запрос
+        """
+        return sum(
+            replica.last_probe_at is not None and replica.healthy and not replica.breaker.is_open
+            for replica in self.replicas
+        )
+
+    # --- фоновые проверки здоровья ---
+
+    async def probe_all(self):
+        """проверяет готовность модели на всех репликах параллельно"""
+        await asyncio.gather(*(self._probe(replica) for replica in self.replicas))
+
+    async def _probe(self, replica: Replica):
+        healthy = await replica.client.is_model_ready(self.probe_timeout)
+        if replica.last_probe_at is None or healthy != replica.healthy:
+            if healthy:
+                logger.info(f"Реплика Triton {replica.url} готова")
+            else:
+                logger.warning(f"Реплика Triton {replica.url} недоступна")
+        replica.healthy = healthy
+        replica.last_probe_at = time.time()
+        TRITON_REPLICA_HEALTHY.labels(replica.url).set(int(healthy))
+
+    async def _probe_loop(self):
+        # пока ни одна реплика не готова (Triton ещё стартует или загружает модель),
+        # проверяем чаще: с STARTUP_PROBE_DELAY, удваивая до probe_interval
+        delay = self.STARTUP_PROBE_DELAY
+        while True:
+            await self.probe_all()
+            if self.healthy_count:
+                delay = self.probe_interval
+            else:
+                delay = min(delay * 2, self.probe_interval)
+            await asyncio.sleep(delay)
+
+    def start(self):
+        """
+        запускает фоновые проверки (внутри работающего event loop); не ждёт Triton -
+        приложение стартует сразу, готовность видна по healthy_count
+        """
+        if self._probe_task is None:
+            self._probe_task = asyncio.ensure_future(self._probe_loop())
+
+    async def close(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+        for replica in self.replicas:
+            await replica.client.close()
+
+    # --- выбор реплики ---
+
+    def _choose(self, operation: str, tried: set):
+        candidates = [r for r in self.replicas if r not in tried and r.breaker.can_pass()]
+        # если фоновая проверка забраковала всех, пробуем всё равно: её данные могли устареть
+        healthy = [r for r in candidates if r.healthy] or candidates
+        decision = {
+            "time": round(time.time(), 3),
+            "operation": operation,
+            "attempt": len(tried) + 1,
+            "scores": {r.url: round(r.score(), 3) for r in healthy},
+            "skipped": {
+                r.url: "tried" if r in tried else "breaker_open" if not r.breaker.can_pass() else "unhealthy"
+                for r in self.replicas if r not in healthy
+            },
+            "replica": None,
+            "outcome": "no_replica",
+        }
+        self.decisions.append(decision)
+        if not healthy:
+            return None, decision
+        replica = min(healthy, key=lambda r: (r.score(), random.random()))
+        decision["replica"] = replica.url
+        decision["outcome"] = "pending"
+        return replica, decision
+
+    def _can_retry(self, tried: set) -> bool:
+        """остались ли попытки и реплика, которую ещё не пробовали; иначе клиенту уходит исходная ошибка"""
+        if len(tried) >= self.max_attempts:
+            return False
+        return any(r not in tried and r.breaker.can_pass() for r in self.replicas)
+
+    def _finish(self, replica: Replica, decision: dict, outcome: str):
+        decision["outcome"] = outcome
+        TRITON_ROUTED.labels(replica.url, outcome).inc()
+        if outcome == "cancelled":
+            replica.breaker.on_cancel()
+        else:
+            # ошибка разбора вывода модели - не вина реплики: она ответила
+            replica.record(outcome in ("ok", "model_output_error"))
+
+    async def _call(self, operation: str, call):
+        """выполняет call(client) на выбранной реплике, при безопасной ошибке - на следующей"""
+        tried = set()
+        while True:
+            replica, decision = self._choose(operation, tried)
+            if replica is None:
+                raise TritonUnavailableError("Нет доступных реплик Triton")
+            tried.add(replica)
+            replica.breaker.on_dispatch()
+            replica.outstanding += 1
+            # любая непредусмотренная ошибка (например, ответ Triton не разобрался) - ошибка реплики;
+            # исход фиксируется в finally, чтобы пробный запрос half_open не остался незавершённым
+            outcome = "error"
+            try:
+                result = await call(replica.client)
+                outcome = "ok"
+                return result
+            except TritonUnavailableError:
+                outcome = "unavailable"
+                if not self._can_retry(tried):
+                    raise
+                logger.warning(f"Реплика {replica.url} недоступна, повтор {operation} на другой реплике")
+            except ModelOutputError:
+                outcome = "model_output_error"
+                raise
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                replica.outstanding -= 1
+                self._finish(replica, decision, outcome)
+
+    # --- интерфейс TritonClient ---
+
+    async def infer(self, prompt_text: str) -> bytes:
+        return await self._call("infer", lambda client: client.infer(prompt_text))
+
+    async def infer_batch(self, prompts: list) -> list:
+        return await self._call("infer_batch", lambda client: client.infer_batch(prompts))
+
+    async def regenerate_slides(self, instruction: str, presentation: bytes, slide_index: int, slide_count: int) -> list:
+        return await self._call(
+            "regenerate_slides",
+            lambda client: client.regenerate_slides(instruction, presentation, slide_index, slide_count),
+        )
+
+    async def infer_stream(self, prompt_text: str):
+        """поток с реплики; на другую реплику переходим, только пока из потока ничего не отдано"""
+        tried = set()
+        while True:
+            replica, decision = self._choose("infer_stream", tried)
+            if replica is None:
+                raise TritonUnavailableError("Нет доступных реплик Triton")
+            tried.add(replica)
+            replica.breaker.on_dispatch()
+            replica.outstanding += 1
+            started = False
+            outcome = "error"
+            try:
+                async for delta in replica.client.infer_stream(prompt_text):
+                    started = True
+                    yield delta
+                outcome = "ok"
+                return
+            except TritonUnavailableError:
+                outcome = "unavailable"
+                if started or not self._can_retry(tried):
+                    raise
+                logger.warning(f"Реплика {replica.url} недоступна, повтор потока на другой реплике")
+            except ModelOutputError:
+                outcome = "model_output_error"
+                raise
+            except (asyncio.CancelledError, GeneratorExit):
+                outcome = "cancelled"
+                raise
+            finally:
+                replica.outstanding -= 1
+                self._finish(replica, decision, outcome)
+
+    def snapshot(self) -> dict:
+        """состояние реплик и последние решения маршрутизации"""
+        return {
+            "protocol": self.protocol,
+            "replicas": [replica.snapshot() for replica in self.replicas],
+            "recent_decisions": list(self.decisions)[::-1],
+        }
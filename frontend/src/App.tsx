@@ -10,7 +10,7 @@ import { TopToolbar } from './components/Toolbar/TopToolbar';
 import { PresentationCanvas } from './components/Canvas/PresentationCanvas';
 import { SettingsModal } from './components/Settings/SettingsModal';
 import { PresentationView } from './components/PresentationView/PresentationView';
-import { generateSlides } from './services/api';
+import { generateSlidesStream, getQueueStatus, logoutUser } from './services/api';
 import { transformAiResponseToSlides } from './services/dataTransformer';
 import { Shape, Slide } from './types';
 import { TemplatesPanel } from './components/Sidebar/TemplatesPanel';
@@ -38,6 +38,12 @@ function App() {
     const [slideAspectRatio, setSlideAspectRatio] = useState('16:9');
     const [isPresenting, setIsPresenting] = useState(false);
     const [isLoadingAi, setIsLoadingAi] = useState(false);
+    // генерация идёт: слайды уже видны, но поток ещё не закончился - новую команду не принимаем
+    const [isStreamingAi, setIsStreamingAi] = useState(false);
+    // место в очереди генерации, пока запрос ждёт модель
+    const [queueInfo, setQueueInfo] = useState<string | null>(null);
+    // промпт последней удачной генерации: повтор того же промпта - просьба о другом варианте
+    const lastAiPromptRef = useRef<string | null>(null);
     const stageRef = useRef<Konva.Stage>(null);
     const jsonInputRef = useRef<HTMLInputElement>(null);
     const activeSlide = slides[activeSlideIndex];
@@ -45,6 +51,12 @@ function App() {
 
     const handleLoginSuccess = () => setIsAuthenticated(true);
 
+    const handleLogout = async () => {
+        await logoutUser();
+        lastAiPromptRef.current = null;
+        setIsAuthenticated(false);
+    };
+
     const applyPresentationState = (newSlides: Slide[]) => {
         if (newSlides && newSlides.length > 0) {
             setSlides(newSlides);
@@ -254,18 +266,61 @@ function App() {
 
     const handleAiCommand = async (prompt: string) => {
         setIsLoadingAi(true);
+        setIsStreamingAi(true);
+        const normalizedPrompt = prompt.trim().toLowerCase();
+        const isRetry = normalizedPrompt === lastAiPromptRef.current;
+        // текущая презентация возвращается, если генерация оборвётся на середине
+        const previousSlides = slides;
+        const previousActiveIndex = activeSlideIndex;
         try {
-            const serverResponse = await generateSlides(prompt);
-            const newSlides = transformAiResponseToSlides(serverResponse);
-            applyPresentationState(newSlides);
+            // Слайды появляются по мере генерации: спиннер убираем после первого,
+            // но поле ввода остаётся заблокированным до конца потока
+            const serverResponse = await generateSlidesStream(prompt, (slideData, index) => {
+                const [newSlide] = transformAiResponseToSlides({ slides: [slideData] });
+                if (!newSlide) return;
+                if (index === 0) {
+                    applyPresentationState([newSlide]);
+                    setIsLoadingAi(false);
+                } else {
+                    setSlides((prevSlides) => [...prevSlides, newSlide]);
+                }
+            }, isRetry);
+            if (!Array.isArray(serverResponse.slides) || serverResponse.slides.length === 0) {
+                // Ответ без слайдов (например, отказ модели) - показываем его как раньше
+                applyPresentationState(transformAiResponseToSlides(serverResponse));
+            } else {
+                lastAiPromptRef.current = normalizedPrompt;
+            }
         } catch (error) {
             console.error("AI Generation Error:", error);
+            setSlides(previousSlides);
+            setActiveSlideIndex(previousActiveIndex);
+            setSelectedId(null);
             alert(error instanceof Error ? error.message : "Произошла ошибка при генерации презентации.");
         } finally {
             setIsLoadingAi(false);
+            setIsStreamingAi(false);
         }
     };
 
+    // Пока виден спиннер, раз в 2 секунды спрашиваем сервер, сколько ещё ждать в очереди
+    useEffect(() => {
+        if (!isLoadingAi) return;
+        const pollQueue = () => {
+            getQueueStatus()
+                .then((status) => setQueueInfo(status.waiting
+                    ? `Перед вами в очереди: ${status.position}, ожидание ~${Math.ceil(status.your_estimated_wait_seconds)} с`
+                    : null))
+                .catch(() => setQueueInfo(null));
+        };
+        pollQueue();
+        const timer = window.setInterval(pollQueue, 2000);
+        return () => {
+            window.clearInterval(timer);
+            setQueueInfo(null);
+        };
+    }, [isLoadingAi]);
+
     useEffect(() => {
         const handleKeyDown = (e: KeyboardEvent) => {
             const target = e.target as HTMLElement;
@@ -288,6 +343,7 @@ function App() {
                 <div className="loading-overlay">
                     <div className="loading-spinner"></div>
                     <p>AI генерирует презентацию...</p>
+                    {queueInfo && <p>{queueInfo}</p>}
                 </div>
             )}
             <div className="app-container">
@@ -304,6 +360,7 @@ function App() {
                         onExportPDF={handleExportPDF}
                         onExportJSON={handleExportJSON}
                         onImportJSON={() => jsonInputRef.current?.click()}
+                        onLogout={handleLogout}
                     />
                     <PresentationCanvas
                         ref={stageRef}
@@ -313,7 +370,7 @@ function App() {
                         onUpdate={updateShape}
                         aspectRatio={slideAspectRatio}
                     />
-                    <AiInputBar onSendCommand={handleAiCommand} isLoading={isLoadingAi} />
+                    <AiInputBar onSendCommand={handleAiCommand} isLoading={isLoadingAi || isStreamingAi} />
                 </main>
                 <div className="right-sidebar">
                     <TemplatesPanel onAddTemplate={addTemplateSlide} />
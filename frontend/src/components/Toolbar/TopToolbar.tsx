@@ -9,6 +9,7 @@ interface TopToolbarProps {
     onExportPDF: () => void;
     onExportJSON: () => void;
     onImportJSON: () => void;
+    onLogout: () => void;
     // onExportPPTX убрали
 }
 
@@ -19,7 +20,8 @@ export const TopToolbar = ({
                                onStartPresentation,
                                onExportPDF,
                                onExportJSON,
-                               onImportJSON
+                               onImportJSON,
+                               onLogout
                            }: TopToolbarProps) => {
     const fileInputRef = useRef<HTMLInputElement>(null);
 
@@ -85,6 +87,9 @@ export const TopToolbar = ({
                 <button className="play-btn" onClick={onStartPresentation} title="Начать презентацию">
                     <SvgIcon path={<polygon points="5 3 19 12 5 21 5 3"></polygon>} />
                 </button>
+                <button className="settings-btn" onClick={onLogout} title="Выйти">
+                    <SvgIcon path={<path d="M9 21H5a2 2 0 0 1-2-2V5a2 2 0 0 1 2-2h4M16 17l5-5-5-5M21 12H9"/>} />
+                </button>
             </div>
         </div>
     );
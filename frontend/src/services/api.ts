@@ -2,6 +2,18 @@ import { Slide } from "../types";
 
 const BASE_URL = process.env.REACT_APP_API_BASE_URL;
 
+// Токен сессии из /api/auth/login: по нему сервер ставит запросы в очередь генерации
+let authToken: string | null = null;
+
+const authHeaders = (): Record<string, string> => (authToken ? { Authorization: `Bearer ${authToken}` } : {});
+
+// 401 на запрос с токеном: сессия истекла (или сервер перезапущен) - токен больше не отправляем
+const dropExpiredSession = (response: Response) => {
+    if (response.status === 401 && authToken) {
+        authToken = null;
+    }
+};
+
 export const loginUser = async (username: string, password: string) => {
     const response = await fetch(`${BASE_URL}/api/auth/login`, {
         method: 'POST',
@@ -16,7 +28,15 @@ export const loginUser = async (username: string, password: string) => {
         throw new Error(errorData.message || 'Ошибка аутентификации');
     }
 
-    return response.json();
+    const data = await response.json();
+    authToken = data.token ?? null;
+    return data;
+};
+
+export const logoutUser = async () => {
+    if (!authToken) return;
+    await fetch(`${BASE_URL}/api/auth/logout`, { method: 'POST', headers: authHeaders() }).catch(() => undefined);
+    authToken = null;
 };
 
 // Теперь эта функция возвращает Promise<any>, так как мы не знаем точный формат ответа
@@ -31,11 +51,13 @@ export const generateSlides = async (prompt: string): Promise<any> => {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
+            ...authHeaders(),
         },
         body: JSON.stringify(requestBody),
     });
 
     if (!response.ok) {
+        dropExpiredSession(response);
         const errorData = await response.json().catch(() => ({ message: 'Ошибка генерации слайдов' }));
         console.error("Сервер вернул ошибку:", errorData);
         const errorMessage = errorData.detail?.[0]?.msg || errorData.message || 'Сервер не смог сгенерировать презентацию';
@@ -46,6 +68,76 @@ export const generateSlides = async (prompt: string): Promise<any> => {
     return response.json();
 };
 
+// Потоковая генерация: сервер присылает Server-Sent Events, каждый слайд - как только он готов.
+// onSlide вызывается для каждого слайда, промис возвращает полную презентацию.
+// noCache - сгенерировать заново, а не вернуть ту же презентацию из кэша сервера
+export const generateSlidesStream = async (
+    prompt: string,
+    onSlide: (slide: any, index: number) => void,
+    noCache: boolean = false,
+): Promise<any> => {
+    const response = await fetch(`${BASE_URL}/api/ai/generate-slides/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            ...authHeaders(),
+        },
+        body: JSON.stringify({ prompt, no_cache: noCache }),
+    });
+
+    if (!response.ok || !response.body) {
+        dropExpiredSession(response);
+        const errorData = await response.json().catch(() => ({ message: 'Ошибка генерации слайдов' }));
+        throw new Error(errorData.detail || errorData.message || 'Сервер не смог сгенерировать презентацию');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // События разделяются пустой строкой
+        let separatorIndex = buffer.indexOf('\n\n');
+        while (separatorIndex !== -1) {
+            const rawEvent = buffer.slice(0, separatorIndex);
+            buffer = buffer.slice(separatorIndex + 2);
+            separatorIndex = buffer.indexOf('\n\n');
+
+            let eventName = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+
+            const payload = JSON.parse(data);
+            if (eventName === 'slide') {
+                onSlide(payload.slide, payload.index);
+            } else if (eventName === 'done') {
+                return payload;
+            } else if (eventName === 'error') {
+                throw new Error(payload.detail || 'Сервер не смог сгенерировать презентацию');
+            }
+        }
+    }
+
+    throw new Error('Соединение с сервером прервано до завершения генерации');
+};
+
+// Состояние очереди генерации (глубина, позиция пользователя, оценка ожидания) - для опроса
+export const getQueueStatus = async () => {
+    const response = await fetch(`${BASE_URL}/api/ai/queue`, { headers: authHeaders() });
+    if (!response.ok) {
+        dropExpiredSession(response);
+        throw new Error('Не удалось получить состояние очереди');
+    }
+    return response.json();
+};
+
 export const getAiSettings = async () => {
     const response = await fetch(`${BASE_URL}/api/admin/ai-settings`);
     if (!response.ok) {
@@ -0,0 +1,404 @@
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import llama_cpp
+from llama_cpp import Llama, LlamaGrammar
+from llama_cpp.llama_grammar import JSON_GBNF
+
+from slide_schema import RESPONSE_SCHEMA, is_valid_patch, is_valid_response, slides_patch_schema
+from speculative import CountingDraftModel
+
+# Формат инструкций Mixtral-Instruct: <s>[INST] {system}\n\n{user} [/INST]
+# Префикс с системным промптом токенизируется отдельно, чтобы его KV-кэш можно было переиспользовать.
+PROMPT_PREFIX_TEMPLATE = "[INST] {system_prompt}\n\n"
+PROMPT_SUFFIX_TEMPLATE = "{user_prompt} [/INST]"
+
+
+def default_threads():
+    """
+    Потоков генерации по умолчанию - как в llama.cpp: половина логических CPU.
+    Декодирование упирается в память, и на SMT второй поток ядра обычно только замедляет его.
+    """
+    return max(os.cpu_count() // 2, 1)
+
+
+def default_batch_threads():
+    """Потоков вычисления промпта по умолчанию - как в llama.cpp: все логические CPU."""
+    return os.cpu_count()
+
+
+class GenerationCancelled(Exception):
+    """клиент отменил запрос - генерация остановлена, контекст возвращён в пул"""
+
+
+def preload_model_file(model_path, chunk_bytes=64 << 20):
+    """
+    Читает GGUF-файл целиком, чтобы веса оказались в page cache до первого запроса:
+    иначе mmap подгружает их случайными page fault'ами прямо во время генерации.
+    Возвращает время чтения в секундах.
+    """
+    started = time.perf_counter()
+    with open(model_path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        buffer = bytearray(chunk_bytes)
+        total = 0
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            total += read
+    elapsed = time.perf_counter() - started
+    print(f"Файл модели прочитан в page cache: {total / 2**30:.1f} ГиБ за {elapsed:.1f} с.")
+    return elapsed
+
+
+class CountingPrefixCache:
+    """
+    Обёртка над кэшем состояний llama.cpp (LlamaRAMCache / LlamaDiskCache),
+    запоминающая длину найденного префикса, чтобы считать попадания.
+    Сам кэш общий для всех контекстов пула, поэтому доступ к нему идёт под блокировкой.
+    """
+    def __init__(self, cache, lock):
+        self.cache = cache
+        self.lock = lock
+        self.last_match_len = 0
+
+    @property
+    def cache_size(self):
+        return self.cache.cache_size
+
+    def __getitem__(self, key):
+        with self.lock:
+            item = self.cache[key]
+        self.last_match_len = Llama.longest_token_prefix(item.input_ids.tolist(), key)
+        return item
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.cache
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.cache[key] = value
+
+
+class LlamaPool:
+    """
+    Пул независимых контекстов llama.cpp над одним GGUF-файлом.
+    Веса отображаются в память через mmap и делятся между контекстами,
+    у каждого контекста свой KV-кэш и своя часть потоков CPU,
+    так что pool_size запросов генерируются одновременно.
+    Модуль не зависит от Triton и используется также в бенчмарке.
+    """
+    def __init__(
+        self,
+        model_path,
+        system_prompt,
+        pool_size=1,
+        n_threads=None,
+        n_ctx=4096,
+        n_gpu_layers=-1,
+        prefix_cache=None,
+        response_grammar="schema",
+        use_mlock=False,
+        n_batch=512,
+        n_threads_batch=None,
+        temperature=0.7,
+        draft_factory=None,
+        verbose=True,
+    ):
+        self.pool_size = pool_size
+        self.threads_per_context = max(1, (n_threads or default_threads()) // pool_size)
+        # потоки для вычисления промпта (и проверки черновика) - отдельно от потоков генерации
+        self.batch_threads_per_context = max(1, (n_threads_batch or default_batch_threads()) // pool_size)
+        self.temperature = temperature
+        # спекулятивное декодирование: draft_factory() создаёт черновик для каждого контекста
+        # (см. speculative.py), None - обычная генерация по одному токену
+        self.speculative = draft_factory is not None
+        # Грамматика ответа компилируется один раз: "schema" - ровно схема презентации/отказа
+        # из slide_schema.py, "json" - любой JSON-объект (как response_format={"type": "json_object"})
+        self.response_grammar = response_grammar
+        if response_grammar == "schema":
+            self.grammar = LlamaGrammar.from_json_schema(json.dumps(RESPONSE_SCHEMA), verbose=False)
+        else:
+            self.grammar = LlamaGrammar.from_string(JSON_GBNF, verbose=False)
+        # грамматики режима правки (ровно N слайдов) компилируются по первому запросу с таким N
+        self._patch_grammars = {}
+        # ответы, не прошедшие проверку схемы, пользователь перегенерирует - их токены потрачены зря
+        self.response_stats = {"responses": 0, "invalid": 0, "generated_tokens": 0, "invalid_tokens": 0}
+        self.draft_stats = {"proposed_tokens": 0, "accepted_tokens": 0}
+
+        self.prefix_stats = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "reused_tokens": 0,
+            "state_restores": 0,
+            "cache_hits": 0,
+        }
+        # вызывается с метриками каждого запроса (время вычисления промпта, токены/с и т.д.)
+        self.on_request_metrics = None
+        self._stats_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._contexts = queue.Queue()
+
+        for i in range(pool_size):
+            model = Llama(
+                model_path=model_path,
+                n_ctx=n_ctx,
+                n_gpu_layers=n_gpu_layers,
+                n_batch=n_batch,
+                n_threads=self.threads_per_context,
+                n_threads_batch=self.batch_threads_per_context,
+                draft_model=CountingDraftModel(draft_factory()) if self.speculative else None,
+                use_mmap=True,
+                use_mlock=use_mlock,  # закрепить веса в RAM: ОС не вытеснит их под нагрузкой
+                verbose=verbose
+            )
+            if i == 0:
+                # Вычисляем системный промпт один раз и сохраняем снимок состояния llama.cpp
+                self.prefix_tokens = model.tokenize(
+                    PROMPT_PREFIX_TEMPLATE.format(system_prompt=system_prompt).encode('utf-8'),
+                    add_bos=True
+                )
+                model.reset()
+                model.eval(self.prefix_tokens)
+                self.prefix_state = model.save_state()
+                self._tokenizer = model
+                print(f"KV-кэш системного промпта сохранён: {len(self.prefix_tokens)} токенов, "
+                      f"{self.prefix_state.llama_state_size / 2**20:.1f} МиБ.")
+            else:
+                model.load_state(self.prefix_state)
+
+            # Необязательный кэш других частых префиксов (LRU, ограничен по размеру в байтах)
+            if prefix_cache is not None:
+                model.set_cache(CountingPrefixCache(prefix_cache, self._cache_lock))
+            self._contexts.put(model)
+
+        print(f"Пул llama.cpp готов: {pool_size} контекст(ов) по {self.threads_per_context} потоков"
+              f"{', спекулятивное декодирование' if self.speculative else ''}.")
+
+    def warm_up(self, user_prompt, max_tokens=16):
+        """
+        Короткая генерация на каждом контексте пула: первый проход по весам, выделение
+        рабочих буферов и (на GPU) компиляция ядер происходят до первого настоящего запроса.
+        В статистику и метрики запросов не попадает. Возвращает время прогрева в секундах.
+        """
+        started = time.perf_counter()
+        prompt_tokens = self.tokenize_prompt(user_prompt)
+        models = [self._contexts.get() for _ in range(self.pool_size)]
+        try:
+            for model in models:
+                self.restore_prefix(model)
+                # с грамматикой ответа: её первое применение тоже небесплатно
+                model.create_completion(
+                    prompt=prompt_tokens, grammar=self.grammar, max_tokens=max_tokens, temperature=self.temperature
+                )
+        finally:
+            for model in models:
+                self._contexts.put(model)
+        elapsed = time.perf_counter() - started
+        print(f"Прогрев пула: {self.pool_size} контекст(ов) по {max_tokens} токенов за {elapsed:.1f} с.")
+        return elapsed
+
+    def tokenize_prompt(self, user_prompt):
+        """Токены полного промпта: закэшированный префикс + промпт пользователя."""
+        suffix_tokens = self._tokenizer.tokenize(
+            PROMPT_SUFFIX_TEMPLATE.format(user_prompt=user_prompt).encode('utf-8'),
+            add_bos=False
+        )
+        return self.prefix_tokens + suffix_tokens
+
+    def count_tokens(self, text):
+        """Число токенов в тексте (для статистики и бенчмарков)."""
+        return len(self._tokenizer.tokenize(text.encode('utf-8'), add_bos=False))
+
+    @contextmanager
+    def acquire(self):
+        """Берёт свободный контекст из пула (ждёт, если все заняты)."""
+        model = self._contexts.get()
+        try:
+            yield model
+        finally:
+            self._contexts.put(model)
+
+    def restore_prefix(self, model):
+        """Восстанавливает KV-кэш системного промпта, если в контексте сейчас что-то другое."""
+        n_prefix = len(self.prefix_tokens)
+        if model.input_ids[:n_prefix].tolist() != self.prefix_tokens:
+            model.load_state(self.prefix_state)
+            with self._stats_lock:
+                self.prefix_stats["state_restores"] += 1
+        if model.cache is not None:
+            model.cache.last_match_len = 0
+
+    def record_prefix_stats(self, model, prompt_tokens):
+        """
+        Учитывает, сколько токенов промпта не пришлось вычислять заново, и печатает долю попаданий.
+        Возвращает (переиспользовано токенов, было ли попадание в кэш префиксов) для метрик запроса.
+        """
+        reused = len(self.prefix_tokens)
+        cache_hit = model.cache is not None and model.cache.last_match_len > reused
+        if cache_hit:
+            # llama.cpp загрузит состояние из кэша, только если оно длиннее системного префикса
+            reused = min(model.cache.last_match_len, len(prompt_tokens) - 1)
+
+        with self._stats_lock:
+            stats = self.prefix_stats
+            stats["requests"] += 1
+            stats["prompt_tokens"] += len(prompt_tokens)
+            stats["reused_tokens"] += reused
+            stats["cache_hits"] += int(cache_hit)
+            print(
+                f"Префикс: переиспользовано {reused}/{len(prompt_tokens)} токенов промпта; "
+                f"всего {stats['reused_tokens'] / stats['prompt_tokens']:.1%} токенов, "
+                f"попаданий в кэш префиксов {stats['cache_hits']}/{stats['requests']}, "
+                f"восстановлений состояния {stats['state_restores']}."
+            )
+        return reused, cache_hit
+
+    def patch_grammar(self, slide_count):
+        """Грамматика ответа в режиме правки: объект {"slides": [...]} ровно из slide_count слайдов."""
+        if self.response_grammar != "schema":
+            return self.grammar
+        grammar = self._patch_grammars.get(slide_count)
+        if grammar is None:
+            grammar = LlamaGrammar.from_json_schema(json.dumps(slides_patch_schema(slide_count)), verbose=False)
+            self._patch_grammars[slide_count] = grammar
+        return grammar
+
+    def check_response(self, text, slide_count=None):
+        """Соответствует ли ответ схеме слайдов (или схеме правки из slide_count слайдов)."""
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            return False
+        if slide_count is None:
+            return is_valid_response(data)
+        return is_valid_patch(data, slide_count)
+
+    def record_request_metrics(self, model, started, first_token_at, prompt_perf, prompt_tokens, text,
+                               slide_count=None, prefix=(0, False)):
+        """
+        Собирает тайминги llama.cpp по запросу, печатает их и передаёт в on_request_metrics.
+        prefix - результат record_prefix_stats: переиспользованные токены и попадание в кэш префиксов.
+        prompt_perf - счётчики llama.cpp на момент первого токена: всё до него - вычисление промпта,
+        после - генерация. При спекулятивном декодировании проверка черновика идёт батчами
+        и попадает в n_p_eval, поэтому токены генерации считаются по контексту, а не по n_eval.
+        """
+        finished = time.perf_counter()
+        perf = llama_cpp.llama_perf_context(model.ctx)
+        if prompt_perf is None:
+            prompt_perf = perf
+        # токены ответа, оставшиеся в контексте (последний выбранный токен не вычисляется)
+        generated = max(0, model.n_tokens - len(prompt_tokens))
+        evaluated = (perf.n_eval + perf.n_p_eval) - (prompt_perf.n_eval + prompt_perf.n_p_eval)
+        decode_ms = (perf.t_eval_ms + perf.t_p_eval_ms) - (prompt_perf.t_eval_ms + prompt_perf.t_p_eval_ms)
+        # вычислено сверх оставшегося в контексте - это отвергнутые токены черновика
+        proposed = model.draft_model.proposed_tokens if self.speculative else 0
+        accepted = max(0, proposed - max(0, evaluated - generated))
+        valid = self.check_response(text, slide_count)
+        with self._stats_lock:
+            stats = self.response_stats
+            stats["responses"] += 1
+            stats["generated_tokens"] += generated
+            if not valid:
+                stats["invalid"] += 1
+                stats["invalid_tokens"] += generated
+            self.draft_stats["proposed_tokens"] += proposed
+            self.draft_stats["accepted_tokens"] += accepted
+        metrics = {
+            "valid_response": valid,
+            "prompt_eval_seconds": prompt_perf.t_p_eval_ms / 1000,
+            "prompt_tokens_evaluated": prompt_perf.n_p_eval,
+            "prompt_tokens_reused": prefix[0],
+            "prefix_cache_hit": prefix[1],
+            "generated_tokens": generated,
+            "tokens_per_second": generated * 1000 / decode_ms if decode_ms > 0 else 0.0,
+            "time_to_first_token_seconds": (first_token_at or finished) - started,
+            "total_seconds": finished - started,
+            "draft_tokens": proposed,
+            "accepted_draft_tokens": accepted,
+        }
+        draft_info = ""
+        if self.speculative:
+            total = self.draft_stats
+            share = total["accepted_tokens"] / total["proposed_tokens"] if total["proposed_tokens"] else 0.0
+            draft_info = f", черновик принят на {accepted}/{proposed} ток. (всего {share:.1%})"
+        print(
+            f"Запрос: промпт {metrics['prompt_tokens_evaluated']} ток. за {metrics['prompt_eval_seconds']:.2f} с, "
+            f"первый токен через {metrics['time_to_first_token_seconds']:.2f} с, "
+            f"сгенерировано {metrics['generated_tokens']} ток. ({metrics['tokens_per_second']:.1f} ток/с){draft_info}, "
+            f"ответ {'соответствует' if valid else 'НЕ соответствует'} схеме "
+            f"(доля повторов {stats['invalid'] / stats['responses']:.1%})."
+        )
+        if self.on_request_metrics is not None:
+            self.on_request_metrics(metrics)
+        return metrics
+
+    def generate(self, user_prompt, max_tokens=None, slide_count=None, is_cancelled=None):
+        """Генерирует ответ целиком на свободном контексте и возвращает текст."""
+        return "".join(self.generate_stream(
+            user_prompt, max_tokens=max_tokens, slide_count=slide_count, is_cancelled=is_cancelled
+        ))
+
+    def generate_stream(self, user_prompt, max_tokens=None, slide_count=None, is_cancelled=None):
+        """
+        Генератор фрагментов текста; контекст занят, пока генератор не исчерпан или не закрыт.
+        slide_count - режим правки: модель пишет только столько слайдов, а не всю презентацию.
+        is_cancelled - функция без аргументов: если она вернула True (клиент ушёл), генерация
+        прерывается исключением GenerationCancelled, и контекст сразу освобождается.
+        """
+        prompt_tokens = self.tokenize_prompt(user_prompt)
+        grammar = self.grammar if slide_count is None else self.patch_grammar(slide_count)
+        cancelled = is_cancelled or (lambda: False)
+        if cancelled():
+            raise GenerationCancelled("Запрос отменён до начала генерации")
+        with self.acquire() as model:
+            # пока ждали свободный контекст, клиент мог уйти
+            if cancelled():
+                raise GenerationCancelled("Запрос отменён в очереди пула")
+            self.restore_prefix(model)
+            llama_cpp.llama_perf_context_reset(model.ctx)
+            if self.speculative:
+                model.draft_model.reset()
+            started = time.perf_counter()
+            first_token_at = None
+            prompt_perf = None
+            parts = []
+            # Грамматика заставляет модель вернуть JSON нужной формы
+            chunks = model.create_completion(
+                prompt=prompt_tokens,
+                grammar=grammar,
+                max_tokens=max_tokens,
+                temperature=self.temperature,
+                stream=True
+            )
+            try:
+                for chunk in chunks:
+                    if cancelled():
+                        raise GenerationCancelled(f"Запрос отменён после {len(parts)} фрагментов")
+                    delta = chunk['choices'][0]['text']
+                    if delta:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                            prompt_perf = llama_cpp.llama_perf_context(model.ctx)
+                        parts.append(delta)
+                        yield delta
+            finally:
+                # останавливаем генератор llama.cpp до возврата контекста в пул
+                chunks.close()
+            prefix = self.record_prefix_stats(model, prompt_tokens)
+            self.record_request_metrics(
+                model, started, first_token_at, prompt_perf, prompt_tokens, "".join(parts), slide_count, prefix
+            )
+
+    def close(self):
+        """Освобождает контексты пула."""
+        while not self._contexts.empty():
+            self._contexts.get_nowait().close()
+        self.prefix_state = None
@@ -1,84 +1,367 @@
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import triton_python_backend_utils as pb_utils
-from llama_cpp import Llama
+from llama_cpp import LlamaRAMCache, LlamaDiskCache
+
+from llama_pool import GenerationCancelled, LlamaPool, default_threads, preload_model_file
+from speculative import make_draft_factory
+
+
+# промпт пробной генерации при загрузке модели
+WARMUP_PROMPT = "Создай презентацию на тему: Строение атома"
+
 
 class TritonPythonModel:
     """
     Модель для Triton Inference Server, использующая llama-cpp-python.
+    В decoupled-режиме (model_transaction_policy в config.pbtxt) умеет отдавать
+    ответ потоком: каждый новый фрагмент текста уходит отдельным ответом.
+    Запросы обслуживаются пулом контекстов llama.cpp (LlamaPool) параллельно:
+    execute раздаёт их по потокам и в decoupled-режиме сразу возвращается,
+    чтобы Triton мог прислать следующую пачку.
     """
     def initialize(self, args):
         """
         Вызывается один раз при загрузке модели.
-        Загружаем модель Mixtral в память.
+        Загружаем модель Mixtral в память, прогреваем KV-кэш системного промпта
+        и, если включено, делаем пробную генерацию: Triton объявит модель готовой
+        только после возврата из initialize, поэтому первый запрос идёт на прогретую модель.
         """
+        self.model_config = json.loads(args["model_config"])
+        self.decoupled = pb_utils.using_decoupled_model_transaction_policy(self.model_config)
         self.model_path = "/models/mixtral-8x7b-instruct-v0.1.Q4_K_M.gguf" # Путь ВНУТРИ Docker-контейнера
         self.system_prompt = self.get_system_prompt()
-        
+        pool_size = int(self.get_parameter("pool_size", 1))
+        n_threads = int(self.get_parameter("n_threads", 0)) or None  # None = половина логических CPU, как в llama.cpp
+        n_ctx = int(self.get_parameter("n_ctx", 4096))
+        n_gpu_layers = int(self.get_parameter("n_gpu_layers", -1))  # -1 = все слои на GPU
+
         print(f"Инициализация модели из {self.model_path}...")
-        
-        # Загружаем модель с помощью llama-cpp-python
-        self.model = Llama(
+        if self.get_parameter("preload", "false").lower() == "true":
+            preload_model_file(self.model_path)
+
+        # Загружаем модель с помощью llama-cpp-python: pool_size контекстов над общими весами
+        self.pool = LlamaPool(
             model_path=self.model_path,
-            n_ctx=4096,       # Максимальный контекст
-            n_gpu_layers=-1,  # -1 означает "загрузить на GPU все слои, которые поместятся"
-            verbose=True,
-            n_threads=None    # None = автоопределение
+            system_prompt=self.system_prompt,
+            pool_size=pool_size,
+            n_threads=n_threads,
+            n_threads_batch=int(self.get_parameter("n_threads_batch", 0)) or None,  # None = все логические CPU
+            n_batch=int(self.get_parameter("n_batch", 512)),
+            n_ctx=n_ctx,       # Максимальный контекст
+            n_gpu_layers=n_gpu_layers,
+            temperature=float(self.get_parameter("temperature", 0.7)),
+            prefix_cache=self.create_prefix_cache(),
+            response_grammar=self.get_parameter("response_grammar", "schema"),
+            use_mlock=self.get_parameter("use_mlock", "false").lower() == "true",
+            draft_factory=make_draft_factory(
+                self.get_parameter("speculative", "none").lower(),
+                num_pred_tokens=int(self.get_parameter("draft_tokens", 10)),
+                max_ngram_size=int(self.get_parameter("lookup_ngram_size", 3)),
+                draft_model_path=self.get_parameter("draft_model_path"),
+                n_ctx=n_ctx,
+                n_gpu_layers=n_gpu_layers,
+                n_threads=max(1, (n_threads or default_threads()) // pool_size),
+            ),
+            verbose=True
         )
-        
-        print("Модель успешно инициализирована.")
+        warmup_tokens = int(self.get_parameter("warmup_tokens", 0))
+        if warmup_tokens > 0:
+            # до подключения метрик: прогрев не должен попасть в статистику запросов
+            self.pool.warm_up(WARMUP_PROMPT, max_tokens=warmup_tokens)
+        self.create_metrics()
+        self.pool.on_request_metrics = self.observe_metrics
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="llama")
+        self.in_flight = 0
+        self.in_flight_lock = threading.Lock()
+        # в decoupled-режиме execute не ждёт генерации; семафор не даёт принять больше запросов,
+        # чем свободных контекстов: иначе они копились бы в очереди executor'а, невидимые Triton,
+        # а dynamic_batching и очередь Triton не работали бы - экземпляр всегда казался бы свободным
+        self.slots = threading.BoundedSemaphore(pool_size)
+
+        print(f"Модель успешно инициализирована (decoupled={self.decoupled}, pool_size={pool_size}).")
+
+    def get_parameter(self, name, default=None):
+        """Значение из секции parameters в config.pbtxt (строкой) или default."""
+        parameter = self.model_config.get("parameters", {}).get(name)
+        if parameter is None or parameter.get("string_value", "") == "":
+            return default
+        return parameter["string_value"]
+
+    def create_prefix_cache(self):
+        """Создаёт кэш префиксов по параметрам prefix_cache ("ram"/"disk"), prefix_cache_bytes и prefix_cache_dir."""
+        cache_type = self.get_parameter("prefix_cache", "none").lower()
+        capacity_bytes = int(self.get_parameter("prefix_cache_bytes", 2 << 30))
+        if cache_type == "ram":
+            cache = LlamaRAMCache(capacity_bytes=capacity_bytes)
+        elif cache_type == "disk":
+            cache_dir = self.get_parameter("prefix_cache_dir", "/tmp/llama_prefix_cache")
+            cache = LlamaDiskCache(cache_dir=cache_dir, capacity_bytes=capacity_bytes)
+        else:
+            return None
+        print(f"Включён кэш префиксов: {cache_type}, до {capacity_bytes / 2**20:.0f} МиБ.")
+        return cache
+
+    def create_metrics(self):
+        """Пользовательские метрики Triton (видны на порту метрик сервера, 8002/metrics)."""
+        labels = {"model": self.model_config["name"]}
+        seconds_buckets = [0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120]
+
+        def histogram(name, description, buckets):
+            family = pb_utils.MetricFamily(name=name, description=description, kind=pb_utils.MetricFamily.HISTOGRAM)
+            self.metric_families.append(family)
+            return family.Metric(labels=labels, buckets=buckets)
+
+        def counter(name, description):
+            family = pb_utils.MetricFamily(name=name, description=description, kind=pb_utils.MetricFamily.COUNTER)
+            self.metric_families.append(family)
+            return family.Metric(labels=labels)
+
+        # семейства должны жить столько же, сколько модель
+        self.metric_families = []
+        self.metrics = {
+            "prompt_eval_seconds": histogram(
+                "llm_prompt_eval_seconds", "Время вычисления промпта (без переиспользованного префикса)", seconds_buckets),
+            "time_to_first_token_seconds": histogram(
+                "llm_time_to_first_token_seconds", "Время до первого сгенерированного токена", seconds_buckets),
+            "tokens_per_second": histogram(
+                "llm_tokens_per_second", "Скорость генерации, токенов в секунду", [1, 2, 5, 10, 15, 20, 30, 50, 100]),
+            "generated_tokens": histogram(
+                "llm_generated_tokens", "Сгенерировано токенов за запрос", [64, 128, 256, 512, 1024, 2048, 4096]),
+            "generated_tokens_total": counter("llm_generated_tokens_total", "Всего сгенерировано токенов"),
+            "prompt_tokens_evaluated_total": counter(
+                "llm_prompt_tokens_evaluated_total", "Всего вычислено токенов промпта"),
+            # доля переиспользованного префикса - reused / (reused + evaluated)
+            "prompt_tokens_reused_total": counter(
+                "llm_prompt_tokens_reused_total",
+                "Токены промпта, взятые из KV-кэша системного промпта или кэша префиксов"),
+            "prefix_cache_hits_total": counter(
+                "llm_prefix_cache_hits_total", "Запросы, продолжившие состояние из кэша префиксов"),
+            "invalid_responses_total": counter(
+                "llm_invalid_responses_total", "Ответы, не соответствующие схеме слайдов (уйдут на перегенерацию)"),
+            "invalid_response_tokens_total": counter(
+                "llm_invalid_response_tokens_total", "Токены, потраченные на ответы вне схемы"),
+            # спекулятивное декодирование: доля принятых - accepted / draft
+            "draft_tokens_total": counter(
+                "llm_draft_tokens_total", "Токены, предложенные черновиком спекулятивного декодирования"),
+            "accepted_draft_tokens_total": counter(
+                "llm_accepted_draft_tokens_total", "Токены черновика, принятые основной моделью"),
+        }
+
+    def observe_metrics(self, request_metrics):
+        """Публикует метрики одного запроса (вызывается из потока пула)."""
+        for name in ("prompt_eval_seconds", "time_to_first_token_seconds", "tokens_per_second", "generated_tokens"):
+            self.metrics[name].observe(request_metrics[name])
+        self.metrics["generated_tokens_total"].increment(request_metrics["generated_tokens"])
+        self.metrics["prompt_tokens_evaluated_total"].increment(request_metrics["prompt_tokens_evaluated"])
+        self.metrics["prompt_tokens_reused_total"].increment(request_metrics["prompt_tokens_reused"])
+        if request_metrics["prefix_cache_hit"]:
+            self.metrics["prefix_cache_hits_total"].increment(1)
+        if request_metrics["draft_tokens"]:
+            self.metrics["draft_tokens_total"].increment(request_metrics["draft_tokens"])
+            self.metrics["accepted_draft_tokens_total"].increment(request_metrics["accepted_draft_tokens"])
+        if not request_metrics["valid_response"]:
+            self.metrics["invalid_responses_total"].increment(1)
+            self.metrics["invalid_response_tokens_total"].increment(request_metrics["generated_tokens"])
 
     def execute(self, requests):
         """
         Вызывается каждый раз, когда приходит один или несколько запросов.
+        Запросы пачки генерируются параллельно на свободных контекстах пула.
+        В decoupled-режиме ответы отправляются через response_sender из рабочих потоков,
+        и метод возвращает None, не дожидаясь генерации, но только когда для каждого
+        запроса нашёлся свободный контекст пула.
         """
-        responses = []
-        
-        # Тритон может присылать запросы пачками (batch)
+        if not self.decoupled:
+            # Тритон может присылать запросы пачками (batch), а в каждом запросе может быть
+            # несколько промптов (батч-измерение входов): все они генерируются параллельно,
+            # ответы нужны в том же порядке
+            batches = []
+            for request in requests:
+                try:
+                    batches.append([
+                        self.executor.submit(
+                            self.pool.generate, user_prompt, slide_count=slide_count, is_cancelled=request.is_cancelled
+                        )
+                        for user_prompt, slide_count in self.get_request_prompts(request)
+                    ])
+                except Exception as e:
+                    batches.append(e)
+            return [self.collect_batch(futures) for futures in batches]
+
         for request in requests:
-            # Получаем входной тензор с промптом пользователя
-            user_prompt_tensor = pb_utils.get_input_tensor_by_name(request, "USER_PROMPT")
-            # Декодируем его из байтов в строку
-            user_prompt = user_prompt_tensor.as_numpy()[0].decode('utf-8')
+            # ждём свободный контекст: пока execute занят, запросы ждут в очереди Triton
+            self.slots.acquire()
+            with self.in_flight_lock:
+                self.in_flight += 1
+            try:
+                self.executor.submit(self.handle_decoupled, request)
+            except Exception:
+                with self.in_flight_lock:
+                    self.in_flight -= 1
+                self.slots.release()
+                raise
+        return None
+
+    def handle_decoupled(self, request):
+        """
+        Обрабатывает один запрос в decoupled-режиме (выполняется в потоке пула).
+        Если клиент отменил запрос (бэкенд закрывает поток, когда браузер ушёл),
+        генерация останавливается и контекст пула освобождается для следующих запросов.
+        """
+        response_sender = request.get_response_sender()
+        try:
+            if self.get_stream_flag(request):
+                user_prompt, slide_count = self.get_request_prompt(request)
+                for delta in self.pool.generate_stream(
+                    user_prompt, slide_count=slide_count, is_cancelled=response_sender.is_cancelled
+                ):
+                    response_sender.send(self.make_response(delta))
+                response_sender.send(flags=pb_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+            else:
+                response_sender.send(
+                    self.generate(request, is_cancelled=response_sender.is_cancelled),
+                    flags=pb_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL
+                )
+        except GenerationCancelled as e:
+            print(f"Генерация прервана: {e}")
+            # отменённому запросу ответ не нужен, но поток ответов надо закрыть
+            response_sender.send(flags=pb_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL)
+        except Exception as e:
+            print(f"Ошибка генерации: {e}")
+            response_sender.send(
+                pb_utils.InferenceResponse(output_tensors=[], error=pb_utils.TritonError(str(e))),
+                flags=pb_utils.TRITONSERVER_RESPONSE_COMPLETE_FINAL
+            )
+        finally:
+            with self.in_flight_lock:
+                self.in_flight -= 1
+            self.slots.release()
 
+    def collect_batch(self, futures):
+        """Ответ на запрос: все его тексты одним тензором или ошибка, если упал хоть один."""
+        if isinstance(futures, Exception):
+            return pb_utils.InferenceResponse(output_tensors=[], error=pb_utils.TritonError(str(futures)))
+        try:
+            return self.make_batch_response([future.result() for future in futures])
+        except Exception as e:
+            print(f"Ошибка генерации: {e}")
+            return pb_utils.InferenceResponse(output_tensors=[], error=pb_utils.TritonError(str(e)))
+
+    def get_user_prompts(self, request):
+        """Достаёт промпты пользователя из запроса: по одному на строку батч-измерения."""
+        # Получаем входной тензор с промптами пользователя
+        user_prompt_tensor = pb_utils.get_input_tensor_by_name(request, "prompt")
+        # Декодируем их из байтов в строки; reshape убирает батч-измерение
+        user_prompts = [prompt.decode('utf-8') for prompt in user_prompt_tensor.as_numpy().reshape(-1)]
+
+        for user_prompt in user_prompts:
             print(f"Получен запрос: {user_prompt}")
+        return user_prompts
 
-            # Формируем полный диалог для модели
-            messages = [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
+    def get_request_prompts(self, request):
+        """
+        Пары (промпт для модели, число слайдов в ответе или None - вся презентация),
+        по одной на каждую строку батч-измерения запроса.
+        Если передан необязательный вход "presentation", это режим правки: "prompt" - инструкция,
+        а перегенерируются только slide_count слайдов начиная с slide_index (нумерация с 0).
+        """
+        user_prompts = self.get_user_prompts(request)
+        presentation_tensor = pb_utils.get_input_tensor_by_name(request, "presentation")
+        if presentation_tensor is None:
+            return [(user_prompt, None) for user_prompt in user_prompts]
 
-            # Вызываем модель для генерации ответа
-            completion = self.model.create_chat_completion(
-                messages=messages,
-                response_format={ # Заставляем модель вернуть JSON
-                    "type": "json_object",
-                },
-                temperature=0.7
-            )
+        presentations = [json.loads(p.decode('utf-8')) for p in presentation_tensor.as_numpy().reshape(-1)]
+        slide_indexes = self.get_int_inputs(request, "slide_index", 0, len(user_prompts))
+        slide_counts = self.get_int_inputs(request, "slide_count", 1, len(user_prompts))
+        items = []
+        for user_prompt, presentation, slide_index, slide_count in zip(
+            user_prompts, presentations, slide_indexes, slide_counts
+        ):
+            if slide_index < 0 or slide_count < 1 or slide_index + slide_count > len(presentation["slides"]):
+                raise ValueError(
+                    f"Слайды {slide_index}..{slide_index + slide_count - 1} вне презентации "
+                    f"из {len(presentation['slides'])} слайдов"
+                )
+            items.append((self.get_edit_prompt(presentation, slide_index, slide_count, user_prompt), slide_count))
+        return items
 
-            # Извлекаем сгенерированный JSON-ответ
-            response_content = completion['choices'][0]['message']['content']
-            
-            # Создаем выходной тензор
-            inference_response = pb_utils.InferenceResponse(
-                output_tensors=[
-                    pb_utils.Tensor(
-                        "GENERATED_JSON",
-                        # Кодируем строку обратно в байты для Тритона
-                        np.array([response_content.encode('utf-8')], dtype=np.object_)
-                    )
-                ]
-            )
-            responses.append(inference_response)
-        
-        return responses
+    def get_request_prompt(self, request):
+        """Единственная пара (промпт, число слайдов) запроса - для потоковой генерации."""
+        items = self.get_request_prompts(request)
+        if len(items) != 1:
+            raise ValueError(f"Потоковая генерация принимает один промпт, получено {len(items)}")
+        return items[0]
+
+    def get_int_inputs(self, request, name, default, count):
+        """Необязательный целочисленный вход: по значению на строку батч-измерения."""
+        tensor = pb_utils.get_input_tensor_by_name(request, name)
+        if tensor is None:
+            return [default] * count
+        return [int(value) for value in tensor.as_numpy().reshape(-1)]
+
+    def get_edit_prompt(self, presentation, slide_index, slide_count, instruction):
+        """
+        Компактный контекст для правки: вся презентация - только типы и заголовки слайдов,
+        заменяемые слайды - целиком. Модель отвечает только новыми слайдами.
+        """
+        first, last = slide_index + 1, slide_index + slide_count
+        outline = "\n".join(
+            f"{number}. {slide['type']}: {slide.get('title', '')}"
+            for number, slide in enumerate(presentation["slides"], start=1)
+        )
+        replaced = json.dumps(presentation["slides"][slide_index:slide_index + slide_count], ensure_ascii=False)
+        target = f"слайд {first}" if slide_count == 1 else f"слайды {first}-{last}"
+        return (
+            f"Это правка готовой презентации «{presentation.get('title', '')}». Её план:\n{outline}\n\n"
+            f"Переделай {target}. Текущее содержимое:\n{replaced}\n\n"
+            f"Инструкция учителя: {instruction}\n\n"
+            f"Верни JSON-объект {{\"slides\": [...]}} с новыми слайдами в том же формате, "
+            f"число слайдов: {slide_count}. Остальные слайды не повторяй."
+        )
+
+    def get_stream_flag(self, request):
+        """Необязательный вход "stream": отдавать ли ответ по частям."""
+        stream_tensor = pb_utils.get_input_tensor_by_name(request, "stream")
+        if stream_tensor is None:
+            return False
+        return bool(stream_tensor.as_numpy().reshape(-1)[0])
+
+    def make_response(self, text):
+        """Оборачивает текст в выходной тензор generated_text."""
+        return self.make_batch_response([text])
+
+    def make_batch_response(self, texts):
+        """Оборачивает тексты в выходной тензор generated_text, по строке на промпт запроса."""
+        return pb_utils.InferenceResponse(
+            output_tensors=[
+                pb_utils.Tensor(
+                    "generated_text",
+                    # Кодируем строки обратно в байты для Тритона; форма [N, 1] - с батч-измерением
+                    np.array([[text.encode('utf-8')] for text in texts], dtype=np.object_)
+                )
+            ]
+        )
+
+    def generate(self, request, is_cancelled=None):
+        """Генерирует ответы на все промпты запроса по очереди и возвращает их одним InferenceResponse."""
+        return self.make_batch_response([
+            self.pool.generate(user_prompt, slide_count=slide_count, is_cancelled=is_cancelled)
+            for user_prompt, slide_count in self.get_request_prompts(request)
+        ])
 
     def finalize(self):
-        """Вызывается при выгрузке модели."""
-        print("Выгрузка модели...")
-        self.model = None
+        """Вызывается при выгрузке модели: дожидаемся незавершённых генераций."""
+        print(f"Выгрузка модели... Незавершённых запросов: {self.in_flight}")
+        self.executor.shutdown(wait=True)
+        print(f"Статистика префиксов: {self.pool.prefix_stats}, ответов: {self.pool.response_stats}")
+        if self.pool.speculative:
+            print(f"Статистика черновика: {self.pool.draft_stats}")
+        self.pool.close()
+        self.pool = None
 
     def get_system_prompt(self):
         """Возвращает полный системный промпт."""
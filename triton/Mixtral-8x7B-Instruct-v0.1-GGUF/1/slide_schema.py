@@ -0,0 +1,92 @@
+"""
+JSON-схема ответа модели: презентация (title + slides из четырёх типов слайдов)
+или объект отказа (error/reason/message). По ней строится грамматика llama.cpp,
+поэтому модель физически не может вернуть JSON другой формы.
+Должна совпадать с pydantic-моделями в backend/schemas.py.
+"""
+
+STRING = {"type": "string"}
+STRING_LIST = {"type": "array", "items": STRING, "minItems": 1}
+
+
+def slide(slide_type, **fields):
+    properties = {"type": {"const": slide_type}, "title": STRING, **fields}
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+
+SLIDE_SCHEMAS = [
+    slide("title_slide", subtitle=STRING),
+    slide("content_slide", content=STRING_LIST, image_description=STRING),
+    slide("image_slide", image_description=STRING),
+    slide("final_slide", subtitle=STRING),
+]
+SLIDE_SCHEMAS_BY_TYPE = {schema["properties"]["type"]["const"]: schema for schema in SLIDE_SCHEMAS}
+
+PRESENTATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": STRING,
+        "slides": {"type": "array", "items": {"oneOf": SLIDE_SCHEMAS}, "minItems": 1},
+    },
+    "required": ["title", "slides"],
+}
+
+ERROR_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "error": {"const": True},
+        "reason": {"enum": ["inappropriate_request", "ambiguous_request"]},
+        "message": STRING,
+    },
+    "required": ["error", "reason", "message"],
+}
+
+RESPONSE_SCHEMA = {"oneOf": [PRESENTATION_SCHEMA, ERROR_SCHEMA]}
+
+
+def slides_patch_schema(count):
+    """Ответ в режиме правки: ровно count новых слайдов на замену выбранным."""
+    slides = {"type": "array", "items": {"oneOf": SLIDE_SCHEMAS}, "minItems": count, "maxItems": count}
+    return {"type": "object", "properties": {"slides": slides}, "required": ["slides"]}
+
+
+def is_valid_response(data):
+    """Проверка разобранного ответа на соответствие RESPONSE_SCHEMA (для статистики и бенчмарка)."""
+    if not isinstance(data, dict):
+        return False
+    if "error" in data:
+        return (
+            set(data) == {"error", "reason", "message"}
+            and data["error"] is True
+            and data["reason"] in ERROR_SCHEMA["properties"]["reason"]["enum"]
+            and isinstance(data["message"], str)
+        )
+    if set(data) != {"title", "slides"} or not isinstance(data["title"], str):
+        return False
+    return isinstance(data["slides"], list) and bool(data["slides"]) and all(map(is_valid_slide, data["slides"]))
+
+
+def is_valid_patch(data, count):
+    """Проверка ответа в режиме правки по slides_patch_schema(count)."""
+    return (
+        isinstance(data, dict)
+        and set(data) == {"slides"}
+        and isinstance(data["slides"], list)
+        and len(data["slides"]) == count
+        and all(map(is_valid_slide, data["slides"]))
+    )
+
+
+def is_valid_slide(item):
+    schema = SLIDE_SCHEMAS_BY_TYPE.get(item.get("type")) if isinstance(item, dict) else None
+    if schema is None or set(item) != set(schema["required"]):
+        return False
+    for name, value in item.items():
+        if name == "type":
+            continue
+        if schema["properties"][name] is STRING_LIST:
+            if not isinstance(value, list) or not value or not all(isinstance(v, str) for v in value):
+                return False
+        elif not isinstance(value, str):
+            return False
+    return True
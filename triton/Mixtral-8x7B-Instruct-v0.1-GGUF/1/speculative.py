@@ -0,0 +1,82 @@
+"""
+Черновые модели для спекулятивного декодирования llama-cpp-python (Llama(draft_model=...)).
+Черновик предлагает несколько следующих токенов, основная модель проверяет их
+одним батчем: принятые токены достаются за один проход вместо нескольких.
+JSON слайдов однообразен (ключи, типы слайдов, "Спасибо за внимание!"), поэтому
+даже поиск продолжения в уже написанном тексте (prompt lookup) угадывает часто.
+"""
+import numpy as np
+
+import llama_cpp
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+SPECULATIVE_MODES = ("none", "prompt_lookup", "draft")
+
+
+class CountingDraftModel(LlamaDraftModel):
+    """
+    Обёртка черновика: считает предложенные токены с последнего reset().
+    Принятые считаются в LlamaPool по разнице вычисленных и оставшихся в контексте токенов.
+    """
+    def __init__(self, draft_model):
+        self.draft_model = draft_model
+        self.proposed_tokens = 0
+
+    def reset(self):
+        self.proposed_tokens = 0
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft_tokens = self.draft_model(input_ids, **kwargs)
+        self.proposed_tokens += len(draft_tokens)
+        return draft_tokens
+
+
+class GgufDraftModel(LlamaDraftModel):
+    """
+    Маленькая модель с тем же словарём (например, Mistral-7B-Instruct для Mixtral):
+    жадно продолжает текст на num_pred_tokens токенов. Свой KV-кэш, синхронизируется
+    с основным контекстом по общему префиксу, так что перевычисляется только новое.
+    """
+    def __init__(self, model_path, num_pred_tokens=8, **llama_options):
+        self.model = Llama(model_path=model_path, use_mmap=True, verbose=False, **llama_options)
+        self.num_pred_tokens = num_pred_tokens
+        self._eos = self.model.token_eos()
+
+    def __call__(self, input_ids, /, **kwargs):
+        model = self.model
+        # откатываем KV-кэш черновика до общего с input_ids префикса (хотя бы один токен вычисляем заново,
+        # чтобы получить логиты последней позиции)
+        n_cached = min(model.n_tokens, len(input_ids) - 1)
+        mismatch = np.nonzero(model.input_ids[:n_cached] != input_ids[:n_cached])[0]
+        model.n_tokens = int(mismatch[0]) if len(mismatch) else n_cached
+        model.eval(input_ids[model.n_tokens:].tolist())
+
+        n_vocab = model.n_vocab()
+        draft_tokens = []
+        for _ in range(self.num_pred_tokens):
+            if model.n_tokens >= model.n_ctx():
+                break
+            logits = np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(model.ctx, -1), shape=(n_vocab,))
+            token = int(np.argmax(logits))
+            if token == self._eos:
+                break
+            draft_tokens.append(token)
+            model.eval([token])
+        return np.array(draft_tokens, dtype=np.intc)
+
+
+def make_draft_factory(mode, num_pred_tokens=10, max_ngram_size=3, draft_model_path=None, **draft_options):
+    """
+    Функция, создающая черновик для очередного контекста пула, или None (mode "none").
+    draft_options - параметры Llama для черновой модели (n_ctx, n_threads, n_gpu_layers).
+    """
+    if mode not in SPECULATIVE_MODES:
+        raise ValueError(f"Неизвестный режим спекулятивного декодирования: {mode}, ожидается один из {SPECULATIVE_MODES}")
+    if mode == "none":
+        return None
+    if mode == "prompt_lookup":
+        return lambda: LlamaPromptLookupDecoding(max_ngram_size=max_ngram_size, num_pred_tokens=num_pred_tokens)
+    if not draft_model_path:
+        raise ValueError("Для режима draft нужен путь к черновой модели (draft_model_path)")
+    return lambda: GgufDraftModel(draft_model_path, num_pred_tokens=num_pred_tokens, **draft_options)
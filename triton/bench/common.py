@@ -0,0 +1,60 @@
+"""
+Общее для бенчмарков пула llama.cpp: путь к коду модели, тестовые промпты,
+аргументы модели в командной строке и создание/освобождение LlamaPool.
+"""
+import gc
+import os
+import sys
+from contextlib import contextmanager
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Mixtral-8x7B-Instruct-v0.1-GGUF", "1")
+sys.path.append(MODEL_DIR)
+
+from llama_pool import LlamaPool, default_threads  # noqa: E402
+
+PROMPTS = [
+    "Создай 3 слайда про строение атома для 8 класса",
+    "Презентация про фотосинтез для 6 класса, 4 слайда",
+    "Сделай 3 слайда о Великой французской революции для 9 класса",
+    "5 слайдов про дроби для 5 класса",
+]
+
+# промпт не про презентацию: модель должна ответить отказом по схеме
+OFF_TOPIC_PROMPT = "Расскажи что-нибудь"
+
+SYSTEM_PROMPT = (
+    "Ты создаёшь образовательные презентации. Отвечай только JSON-объектом "
+    "с полями title и slides (title_slide, content_slide, image_slide, final_slide)."
+)
+
+
+def add_model_args(parser):
+    """аргументы, общие для всех бенчмарков: модель и её размещение на CPU/GPU"""
+    parser.add_argument("--model", required=True, help="путь к GGUF-файлу")
+    parser.add_argument("--threads", type=int, default=None, help="всего потоков CPU (по умолчанию половина логических, как в llama.cpp)")
+    parser.add_argument("--n-ctx", type=int, default=4096)
+    parser.add_argument("--n-gpu-layers", type=int, default=0)
+
+
+@contextmanager
+def open_pool(args, system_prompt=SYSTEM_PROMPT, pool_size=1, **pool_kwargs):
+    """
+    LlamaPool по аргументам add_model_args; после выхода из блока контексты освобождаются
+    и память собирается, чтобы следующий прогон не делил RAM/VRAM с предыдущим.
+    """
+    pool = LlamaPool(
+        model_path=args.model,
+        system_prompt=system_prompt,
+        pool_size=pool_size,
+        n_threads=args.threads,
+        n_ctx=args.n_ctx,
+        n_gpu_layers=args.n_gpu_layers,
+        verbose=False,
+        **pool_kwargs
+    )
+    try:
+        yield pool
+    finally:
+        pool.close()
+        del pool
+        gc.collect()
@@ -0,0 +1,43 @@
+"""
+Бенчмарк пула контекстов llama.cpp (LlamaPool из llama_pool.py): запросы/с в зависимости от pool_size.
+
+Запускается внутри контейнера Triton (где установлен llama-cpp-python), без самого сервера:
+    python3 bench/pool_benchmark.py --model /models/mixtral-8x7b-instruct-v0.1.Q4_K_M.gguf \
+        --pool-sizes 1 2 4 --requests 8 --max-tokens 256
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import PROMPTS, add_model_args, default_threads, open_pool
+
+
+def run(pool_size, args):
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(args.requests)]
+    tokens = 0
+    with open_pool(args, pool_size=pool_size) as pool:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            for text in executor.map(lambda p: pool.generate(p, max_tokens=args.max_tokens), prompts):
+                tokens += pool.count_tokens(text)
+        elapsed = time.perf_counter() - started
+    return elapsed, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_model_args(parser)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=8, help="запросов на каждый размер пула")
+    parser.add_argument("--max-tokens", type=int, default=256)
+    args = parser.parse_args()
+
+    print(f"{'pool_size':>9} {'потоков/ctx':>11} {'время, с':>9} {'запр/с':>8} {'ток/с':>8}")
+    for pool_size in args.pool_sizes:
+        elapsed, tokens = run(pool_size, args)
+        threads = max(1, (args.threads or default_threads()) // pool_size)
+        print(f"{pool_size:>9} {threads:>11} {elapsed:>9.1f} {args.requests / elapsed:>8.3f} {tokens / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Бенчмарк грамматики ответа (параметр response_grammar): "json" - любой JSON-объект,
+"schema" - JSON строго по схеме слайдов из slide_schema.py.
+
+Для каждой грамматики печатает долю ответов вне схемы (их пользователь перегенерирует,
+то есть это доля повторов), токены на ответ и токены на один годный ответ с учётом повторов.
+Разница последних двух строк - сколько токенов экономит декодирование по схеме.
+
+Запускается внутри контейнера Triton (где установлен llama-cpp-python), без самого сервера:
+    python3 bench/schema_benchmark.py --model /models/mixtral-8x7b-instruct-v0.1.Q4_K_M.gguf \
+        --requests 20 --max-tokens 1024
+"""
+import argparse
+import time
+
+from common import OFF_TOPIC_PROMPT, PROMPTS, SYSTEM_PROMPT, add_model_args, open_pool
+
+# отказ тоже должен укладываться в схему
+SCHEMA_PROMPTS = PROMPTS + [OFF_TOPIC_PROMPT]
+
+
+def run(response_grammar, system_prompt, args):
+    with open_pool(args, system_prompt=system_prompt, response_grammar=response_grammar) as pool:
+        started = time.perf_counter()
+        for i in range(args.requests):
+            pool.generate(SCHEMA_PROMPTS[i % len(SCHEMA_PROMPTS)], max_tokens=args.max_tokens)
+        elapsed = time.perf_counter() - started
+        stats = dict(pool.response_stats)
+    return elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_model_args(parser)
+    parser.add_argument("--grammars", nargs="+", default=["json", "schema"], choices=["json", "schema"])
+    parser.add_argument("--requests", type=int, default=20, help="запросов на каждую грамматику")
+    parser.add_argument("--max-tokens", type=int, default=1024, help="ответ, упёршийся в лимит, считается невалидным")
+    parser.add_argument("--system-prompt-file", default=None, help="системный промпт из файла (по умолчанию короткий)")
+    args = parser.parse_args()
+
+    system_prompt = SYSTEM_PROMPT
+    if args.system_prompt_file:
+        with open(args.system_prompt_file, encoding="utf-8") as f:
+            system_prompt = f.read()
+
+    cost_per_valid = {}
+    print(f"{'грамматика':>10} {'время, с':>9} {'вне схемы':>10} {'ток/ответ':>10} {'ток/годный':>11}")
+    for grammar in args.grammars:
+        elapsed, stats = run(grammar, system_prompt, args)
+        valid = stats["responses"] - stats["invalid"]
+        invalid_rate = stats["invalid"] / stats["responses"]
+        tokens_per_response = stats["generated_tokens"] / stats["responses"]
+        # каждый невалидный ответ - повтор: на годный ответ в среднем уходят и токены неудачных попыток
+        cost_per_valid[grammar] = stats["generated_tokens"] / valid if valid else float("inf")
+        print(f"{grammar:>10} {elapsed:>9.1f} {invalid_rate:>10.1%} "
+              f"{tokens_per_response:>10.1f} {cost_per_valid[grammar]:>11.1f}")
+
+    if {"json", "schema"} <= cost_per_valid.keys():
+        saved = cost_per_valid["json"] - cost_per_valid["schema"]
+        print(f"Экономия декодирования по схеме: {saved:.1f} ток. на годный ответ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Бенчмарк спекулятивного декодирования (параметр speculative): скорость генерации и доля
+принятых токенов черновика в сравнении с обычной генерацией ("none").
+
+Для каждого режима печатает скорость генерации (токены ответа на секунду декодирования),
+полное время, долю принятых токенов черновика и ускорение относительно "none".
+Ответы генерируются по схеме слайдов, как в модели; temperature стоит проверить и 0.7, и ниже -
+от неё сильно зависит доля принятых.
+
+Запускается внутри контейнера Triton (где установлен llama-cpp-python), без самого сервера:
+    python3 bench/speculative_benchmark.py --model /models/mixtral-8x7b-instruct-v0.1.Q4_K_M.gguf \
+        --modes none prompt_lookup --requests 8 --max-tokens 1024 --temperature 0.7
+С черновой моделью:
+    python3 bench/speculative_benchmark.py --model /models/mixtral-8x7b-instruct-v0.1.Q4_K_M.gguf \
+        --modes none prompt_lookup draft --draft-model /models/mistral-7b-instruct-v0.2.Q4_K_M.gguf
+"""
+import argparse
+import time
+
+# common добавляет в sys.path каталог модели, откуда берётся speculative
+from common import PROMPTS, add_model_args, default_threads, open_pool
+from speculative import SPECULATIVE_MODES, make_draft_factory
+
+
+def run(mode, args):
+    draft_factory = make_draft_factory(
+        mode,
+        num_pred_tokens=args.draft_tokens,
+        max_ngram_size=args.ngram_size,
+        draft_model_path=args.draft_model,
+        n_ctx=args.n_ctx,
+        n_gpu_layers=args.n_gpu_layers,
+        n_threads=args.threads or default_threads(),
+    )
+    requests = []
+    with open_pool(args, temperature=args.temperature, draft_factory=draft_factory) as pool:
+        pool.on_request_metrics = requests.append
+        pool.warm_up(PROMPTS[0])
+
+        started = time.perf_counter()
+        for i in range(args.requests):
+            pool.generate(PROMPTS[i % len(PROMPTS)], max_tokens=args.max_tokens)
+        elapsed = time.perf_counter() - started
+
+    generated = sum(r["generated_tokens"] for r in requests)
+    decode_seconds = sum(r["generated_tokens"] / r["tokens_per_second"] for r in requests if r["tokens_per_second"])
+    proposed = sum(r["draft_tokens"] for r in requests)
+    accepted = sum(r["accepted_draft_tokens"] for r in requests)
+    return {
+        "elapsed": elapsed,
+        "tokens_per_second": generated / decode_seconds if decode_seconds else 0.0,
+        "acceptance": accepted / proposed if proposed else None,
+        "accepted_per_token": accepted / generated if generated else 0.0,
+        "invalid": sum(not r["valid_response"] for r in requests),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_model_args(parser)
+    parser.add_argument("--modes", nargs="+", default=["none", "prompt_lookup"], choices=SPECULATIVE_MODES)
+    parser.add_argument("--draft-model", default=None, help="GGUF черновой модели для режима draft")
+    parser.add_argument("--draft-tokens", type=int, default=10, help="токенов черновика за шаг")
+    parser.add_argument("--ngram-size", type=int, default=3, help="максимальная n-грамма для prompt_lookup")
+    parser.add_argument("--requests", type=int, default=8, help="запросов на каждый режим")
+    parser.add_argument("--max-tokens", type=int, default=1024)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'режим':>14} {'время, с':>9} {'ток/с':>7} {'принято':>8} {'принято/ток':>12} "
+          f"{'вне схемы':>10} {'ускорение':>10}")
+    for mode in args.modes:
+        result = run(mode, args)
+        if mode == "none":
+            baseline = result["tokens_per_second"]
+        acceptance = "-" if result["acceptance"] is None else f"{result['acceptance']:.1%}"
+        speedup = f"{result['tokens_per_second'] / baseline:.2f}x" if baseline else "-"
+        print(f"{mode:>14} {result['elapsed']:>9.1f} {result['tokens_per_second']:>7.1f} {acceptance:>8} "
+              f"{result['accepted_per_token']:>12.1%} {result['invalid']:>10} {speedup:>10}")
+
+
+if __name__ == "__main__":
+    main()